@@ -1,12 +1,19 @@
 
-import os, json, re, math, urllib.parse, io, datetime, uuid
+import os, json, math, io, datetime, uuid, gzip, hashlib, bisect, itertools, heapq, random, time
 from collections import defaultdict
-from flask import Flask, render_template, request
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
+import numpy as np
+from flask import Flask, render_template, stream_template, request, jsonify, stream_with_context, redirect
 import config
+from catalog_index import load_catalog, score_item, top_rte, nearest_recipes, recipe_lines
+from links import clean_query, go_path, resolve as resolve_link
+from plan_model import Day, Meal, ExtraItems
+from plan_cache import PlanCache
+from solver import improve_week
+import metrics
+from metrics import stage
+from plan_store import make_plan_store, new_plan_id
+from pdf_render import PdfCache, render_document, document_key
+from pdf_jobs import PdfJobQueue
 
 app = Flask(__name__)
 
@@ -35,21 +42,6 @@ def allow_ghl_embed(resp):
     return resp
 
 # ---------------- helpers ----------------
-def clean_query(name: str):
-    name = re.sub(r"[^A-Za-z0-9 ]+", " ", name).strip().lower()
-    name = re.sub(r"\\s+", " ", name)
-    return urllib.parse.quote_plus(name)
-
-def instacart_search_url(query: str):
-    q = clean_query(query)
-    sid = uuid.uuid4()
-    pvid = uuid.uuid4()
-    return f"https://www.instacart.com/store/s?k={q}&search_id={sid}&page_view_id={pvid}&utm_campaign={urllib.parse.quote_plus(getattr(config,'UTM_CAMPAIGN','corporate-cut'))}"
-
-def load_catalog():
-    with open(os.path.join("data","catalog.json"),"r") as f:
-        return json.load(f)
-
 def tdee_from_goal(goal, bodyweight):
     mult = {"Fat loss": 11, "Recomp": 12, "Maintenance": 14}.get(goal, 12)
     return int(bodyweight * mult)
@@ -80,26 +72,18 @@ def tdee_from_bmr_goal(bmr: float, goal: str, activity_level: str):
     adj = {"Fat loss": 0.85, "Recomp": 0.95, "Maintenance": 1.00}.get(goal, 0.95)
     return int(round(tdee * adj)), int(round(tdee))
 
-def low_carb_ok(obj, max_c=20, is_recipe=False):
-    C = obj["macros"]["C"]
-    if is_recipe:
-        return C <= max_c*2
-    return C <= max_c
-
 # ---------------- selection ----------------
-def score_item(item, per_meal_k):
-    P = max(1, item["macros"]["P"])
-    ppd = float(item["price"]) / max(1e-6,(P/25.0))
-    return abs(item["macros"]["K"] - per_meal_k) * 0.55 + ppd * 0.45
-
-def choose_items(catalog, total_meals, time_per_cook, per_meal_k, low_carb=False):
-    rte = list(catalog["rte"])
-    recipes = list(catalog["recipes"])
-    if low_carb:
-        rte = [r for r in rte if low_carb_ok(r, 20, False)]
-        recipes = [r for r in recipes if low_carb_ok(r, 40, True)]
-    rte.sort(key=lambda x: score_item(x, per_meal_k))
-    recipes.sort(key=lambda r: abs(r["macros"]["K"] - per_meal_k))
+def choose_items(catalog, total_meals, time_per_cook, per_meal_k, low_carb=False, rng=None, noise=0.0):
+    view = catalog.view(low_carb)
+    if rng is not None:
+        # randomized restart: seeded multiplicative noise on the scores breaks ties and near-ties differently
+        rte = sorted(view["rte"], key=lambda x: score_item(x, per_meal_k) * (1 + rng.uniform(-noise, noise)))
+        recipes = sorted(view["recipes"], key=lambda r: abs(r["macros"]["K"] - per_meal_k) * (1 + rng.uniform(-noise, noise)))
+    else:
+        # only the best total_meals of each list can be reached; the round-robin tail
+        # below runs only when both lists were short enough to be taken whole
+        rte = top_rte(view["rte"], view["rte_buckets"], per_meal_k, total_meals)
+        recipes = nearest_recipes(view["recipes"], view["recipes_by_k"], view["recipe_ks"], per_meal_k, total_meals)
 
     ratio = 0.6 if int(time_per_cook) > 10 else 0.75
     target_rte = int(total_meals * ratio)
@@ -109,7 +93,7 @@ def choose_items(catalog, total_meals, time_per_cook, per_meal_k, low_carb=False
     while len(out) < total_meals and guard < 10000:
         guard += 1
         made=False
-        need_rte = (len([x for x in out if x["type"]=="rte"]) < target_rte)
+        need_rte = (i < target_rte)   # i == number of RTE meals appended so far
         if (need_rte or j>=len(recipes)) and i < len(rte):
             out.append({"type":"rte","ref":rte[i]}); i+=1; made=True
         elif j < len(recipes):
@@ -128,13 +112,11 @@ def choose_items(catalog, total_meals, time_per_cook, per_meal_k, low_carb=False
     return out
 
 def build_week_plan(chosen, meals_per_day, days, per_meal_target_k, catalog, low_carb=False):
-    side_pool = sorted(
-        [i for i in catalog["rte"] if (60<=i["macros"]["K"]<=350) and (low_carb_ok(i, 20) if low_carb else True)],
-        key=lambda x: x["macros"]["K"]
-    )
+    view = catalog.view(low_carb)
+    side_pool, side_ks = view["side_pool"], view["side_ks"]
     days_plan = []
     idx=0
-    extras=[]
+    extras=ExtraItems()
     for d in range(days):
         meals=[]
         for m in range(meals_per_day):
@@ -145,23 +127,25 @@ def build_week_plan(chosen, meals_per_day, days, per_meal_target_k, catalog, low
             else:
                 title = it["ref"]["title"]; macros = it["ref"]["macros"].copy()
 
+            # side_pool is kcal-sorted and the meal only gets heavier, so the sides that
+            # still fit are always a prefix: stop at the first one that does not
             tries=0
-            for s in side_pool:
+            hi = bisect.bisect_right(side_ks, per_meal_target_k + 200 - macros["K"])
+            for s in itertools.islice(side_pool, hi):
                 if tries>6: break
                 if macros["K"]>=per_meal_target_k-30: break
-                if macros["K"] + s["macros"]["K"] <= per_meal_target_k + 200:
-                    for k in ("P","C","F","K"): macros[k]+=s["macros"][k]
-                    title += " + " + s["name"]
-                    extras.append({"type":"rte","ref":s,"day":d,"meal":len(meals)})
-                    tries+=1
-            meals.append({"title":title,"macros":macros})
-        days_plan.append({"meals":meals,"total_protein":sum(m["macros"]["P"] for m in meals),"total_calories":sum(m["macros"]["K"] for m in meals)})
+                if macros["K"] + s["macros"]["K"] > per_meal_target_k + 200: break
+                for k in ("P","C","F","K"): macros[k]+=s["macros"][k]
+                title += " + " + s["name"]
+                extras.append({"type":"rte","ref":s,"day":d,"meal":len(meals)})
+                tries+=1
+            meals.append(Meal(title, macros))
+        days_plan.append(Day(meals))
     return days_plan, extras
 
 def add_item_to_lightest(day, item, extra_items, day_index):
-    m_idx = min(range(len(day["meals"])), key=lambda i: day["meals"][i]["macros"]["K"])
-    meal = day["meals"][m_idx]
-    for k in ("P","C","F","K"): meal["macros"][k]+=item["macros"][k]
+    m_idx = day.lightest()
+    day.add(m_idx, item["macros"])
     extra_items.append({"type":"rte","ref":item,"day":day_index,"meal":m_idx})
 
 def day_penalty(P,C,F,K, target_K, target_P, shares, protein_cap=None):
@@ -175,6 +159,33 @@ def day_penalty(P,C,F,K, target_K, target_P, shares, protein_cap=None):
         over_cap_pen = (P - protein_cap) / max(1, protein_cap) * 8.0  # strong penalty
     return kcal_band*3 + prot_floor*4 + sum(shares_pen) + over_cap_pen
 
+def day_penalty_vec(P,C,F,K, target_K, target_P, shares, protein_cap=None):
+    # array form of day_penalty; same operation order so scores match the scalar version exactly
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_pct=(P*4)/K; c_pct=(C*4)/K; f_pct=(F*9)/K
+        kcal_band = np.abs(K - target_K) / target_K
+        prot_floor = np.maximum(0, (target_P - P)/max(1,target_P))
+        shares_pen = np.abs(p_pct-shares["P"]) + np.abs(c_pct-shares["C"]) + np.abs(f_pct-shares["F"])
+        pen = kcal_band*3 + prot_floor*4 + shares_pen
+        if protein_cap is not None:
+            pen = pen + np.where(P > protein_cap, (P - protein_cap) / max(1, protein_cap) * 8.0, 0.0)
+    return np.where(K==0, 1e9, pen)
+
+def best_candidate(scan, P,C,F,K, target_K, protein_target, shares, protein_cap, max_k, skip_boosters):
+    """(row of the lowest-penalty eligible candidate or None, number of candidates scored); first one wins ties."""
+    ok = scan["K"] <= max_k
+    if skip_boosters:
+        ok &= ~scan["booster"]
+    sel = np.flatnonzero(ok)
+    if not sel.size:
+        return None, 0
+    pens = day_penalty_vec(P+scan["P"][sel], C+scan["C"][sel], F+scan["F"][sel], K+scan["K"][sel],
+                           target_K, protein_target, shares, protein_cap=protein_cap)
+    j = int(np.argmin(pens))
+    if not pens[j] < 1e18:
+        return None, int(sel.size)
+    return int(scan["rows"][sel[j]]), int(sel.size)
+
 def macro_gap(P,C,F,K, shares, protein_target, protein_cap):
     if K==0: return "P"
     p_now = (P*4)/K; c_now = (C*4)/K; f_now = (F*9)/K
@@ -185,197 +196,150 @@ def macro_gap(P,C,F,K, shares, protein_target, protein_cap):
         diffs["P"] = -1e12
     return max(diffs, key=lambda k: diffs[k])
 
-def balance_macros_for_week(plan_days, target, catalog, extra_items, low_carb=False):
-    boosters = [i for i in catalog["rte"] if i["macros"]["P"]>=25 and i["macros"]["K"]<=230]
-    carb_fillers = [i for i in catalog["rte"] if i["macros"]["C"]>=25]
-    fat_fillers  = [i for i in catalog["rte"] if i["macros"]["F"]>=10]
-    balanced_fillers = [i for i in catalog["rte"] if 12<=i["macros"]["P"]<=24 and 15<=i["macros"]["C"]<=35]
-    micro = [i for i in catalog["rte"] if i["macros"]["K"]<=120]
-    candidates = boosters + carb_fillers + fat_fillers + balanced_fillers + micro
-    if low_carb:
-        candidates = [c for c in candidates if low_carb_ok(c, 20)]
+def balance_macros_for_week(plan_days, target, catalog, extra_items, low_carb=False, pass_name="balance"):
+    view = catalog.view(low_carb)
+    scans = view["scan"]
 
     target_K = int(target["calories"])
     protein_target = int(target["protein_g"])
     protein_cap    = int(target.get("protein_cap", protein_target))
     shares = target["shares"]
 
-    def totals(day):
-        P=sum(m["macros"]["P"] for m in day["meals"])
-        C=sum(m["macros"]["C"] for m in day["meals"])
-        F=sum(m["macros"]["F"] for m in day["meals"])
-        K=sum(m["macros"]["K"] for m in day["meals"])
-        return P,C,F,K
-
+    iterations=evaluated=added=removed=0
+    exits=defaultdict(int)
     for d_i, day in enumerate(plan_days):
+        reason="max_iterations"
         for _ in range(160):
-            P,C,F,K = totals(day)
+            iterations+=1
+            P,C,F,K = day.totals()
             lower, upper = target_K*0.95, target_K*1.05
 
             if P > protein_cap and extra_items:
-                cands=[ex for ex in extra_items if ex.get("day")==d_i]
+                cands=extra_items.for_day(d_i)
                 if cands:
                     ex=max(cands, key=lambda e:e["ref"]["macros"]["P"])
-                    m_idx=ex.get("meal",0)
-                    meal=day["meals"][m_idx]
-                    for k2 in ("P","C","F","K"):
-                        meal["macros"][k2]=max(0, meal["macros"][k2]-ex["ref"]["macros"][k2])
-                    extra_items.remove(ex)
+                    day.remove(ex.get("meal",0), ex["ref"]["macros"])
+                    extra_items.remove(ex); removed+=1
                     continue
 
             if lower <= K <= upper and P>=protein_target:
                 p_pct=(P*4)/K; c_pct=(C*4)/K; f_pct=(F*9)/K
                 if (abs(p_pct-shares["P"])<=0.04 and abs(c_pct-shares["C"])<=0.04 and abs(f_pct-shares["F"])<=0.04 and P <= protein_cap):
-                    break
+                    reason="target_met"; break
 
             if K>upper and extra_items:
-                cands=[ex for ex in extra_items if ex.get("day")==d_i]
+                cands=extra_items.for_day(d_i)
                 if cands:
                     ex=max(cands, key=lambda e:e["ref"]["macros"]["K"])
-                    m_idx=ex.get("meal",0)
-                    meal=day["meals"][m_idx]
-                    for k2 in ("P","C","F","K"):
-                        meal["macros"][k2]=max(0, meal["macros"][k2]-ex["ref"]["macros"][k2])
-                    extra_items.remove(ex)
+                    day.remove(ex.get("meal",0), ex["ref"]["macros"])
+                    extra_items.remove(ex); removed+=1
                     continue
                 else:
-                    break
+                    reason="over_kcal_no_extras"; break
 
             gap = macro_gap(P,C,F,K, shares, protein_target, protein_cap)
             if gap=="P" and P >= protein_target:
                 gap = "C" if (shares["C"] - (C*4)/K) > (shares["F"] - (F*9)/K) else "F"
 
-            pool = boosters if gap=="P" else (carb_fillers if gap=="C" else fat_fillers)
-            if low_carb and gap=="C":
-                pool = [i for i in balanced_fillers if i["macros"]["C"]<=18] + [i for i in micro if i["macros"]["C"]<=10]
             margin = target_K - K
-            best=None; best_pen=1e18
-            for cand in pool + candidates:
-                if gap!="P" and cand in boosters and P >= protein_target:
-                    continue
-                if low_carb and not low_carb_ok(cand, 20):
-                    continue
-                if cand["macros"]["K"] > min(350, margin+200):
-                    continue
-                P2, C2, F2, K2 = P+cand["macros"]["P"], C+cand["macros"]["C"], F+cand["macros"]["F"], K+cand["macros"]["K"]
-                pen = day_penalty(P2,C2,F2,K2, target_K, protein_target, shares, protein_cap=protein_cap)
-                if pen < best_pen:
-                    best_pen = pen; best = cand
-            if best:
-                add_item_to_lightest(day, best, extra_items, d_i)
+            row, n = best_candidate(scans[gap], P,C,F,K, target_K, protein_target, shares, protein_cap,
+                                    max_k=min(350, margin+200), skip_boosters=(gap!="P" and P >= protein_target))
+            evaluated+=n
+            if row is not None:
+                add_item_to_lightest(day, catalog.rte[row], extra_items, d_i); added+=1
                 continue
 
-            break
+            reason="no_candidate"; break
+        exits[reason]+=1
 
-        day["total_protein"]=sum(m["macros"]["P"] for m in day["meals"])
-        day["total_calories"]=sum(m["macros"]["K"] for m in day["meals"])
+    metrics.BALANCE_ITERATIONS.inc(iterations, stage=pass_name)
+    metrics.CANDIDATES_EVALUATED.inc(evaluated, stage=pass_name)
+    metrics.EXTRAS_ADDED.inc(added, stage=pass_name)
+    metrics.EXTRAS_REMOVED.inc(removed, stage=pass_name)
+    for reason, n in exits.items():
+        metrics.LOOP_EXITS.inc(n, loop=pass_name, reason=reason)
     return plan_days, extra_items
 
 def item_price(it):
     return float(it["ref"]["price"] if it["type"]=="rte" else it["ref"]["price_per_serv"])
 
 def cheap_fillers(catalog, low_carb=False):
-    fillers = [x for x in catalog["rte"] if x["macros"]["K"]>=60]
-    if low_carb:
-        fillers = [x for x in fillers if low_carb_ok(x, 20)]
-    return sorted(fillers, key=lambda r: (r["price"]/max(1,r["macros"]["K"])))
+    return catalog.view(low_carb)["cheap_fillers"]
+
+def best_filler(frontier, K, target_K, headroom):
+    """Index into frontier["items"] of the best kcal-gain per dollar that fits headroom (first on ties), or None."""
+    gain = np.minimum(target_K, K + frontier["K"]) - K
+    score = np.where(frontier["price"] <= headroom, gain / np.maximum(0.01, frontier["price"]), -np.inf)
+    if not score.size:
+        return None
+    j = int(np.argmax(score))
+    return j if score[j] > -1 else None
 
 def top_up_days_with_budget(days_plan, extras, catalog, target, current_cost, budget, low_carb=False):
-    fillers = cheap_fillers(catalog, low_carb)
+    # only fillers on the price/kcal frontier can win, see CatalogIndex.filler_frontier
+    frontier = catalog.view(low_carb)["filler_frontier"]
     target_K = int(target["calories"]); lower = target_K*0.95
     headroom = max(0.0, budget - current_cost)
 
-    def day_totals(d):
-        K=sum(m["macros"]["K"] for m in d["meals"])
-        P=sum(m["macros"]["P"] for m in d["meals"])
-        C=sum(m["macros"]["C"] for m in d["meals"]); F=sum(m["macros"]["F"] for m in d["meals"])
-        return P,C,F,K
-
-    changed=True
-    while headroom > 0.25 and changed:
-        changed=False
-        deficits=[(i, day_totals(d)[3]) for i,d in enumerate(days_plan)]
-        i_min, k_min = min(deficits, key=lambda t: t[1])
-        if k_min >= lower: break
+    # min-heap of (day kcal, day index); entries go stale when their day gets a filler
+    heap=[(d.K, i) for i,d in enumerate(days_plan)]
+    heapq.heapify(heap)
+    added=0; reason="budget_spent"
+    while headroom > 0.25 and heap:
+        k_min, i_min = heap[0]
+        if k_min != days_plan[i_min].K:
+            heapq.heappop(heap); continue
+        if k_min >= lower: reason="all_days_fed"; break
         day = days_plan[i_min]
-        P,C,F,K = day_totals(day)
-        best=None; best_score=-1
-        for cand in fillers:
-            price=cand["price"]
-            if price>headroom: continue
-            P2,C2,F2,K2 = P+cand["macros"]["P"], C+cand["macros"]["C"], F+cand["macros"]["F"], K+cand["macros"]["K"]
-            gain = min(target_K, K2) - K
-            score = gain / max(0.01, price)
-            if score>best_score:
-                best=(cand, i_min); best_score=score
-        if best:
-            cand, di = best
-            m_idx = min(range(len(day["meals"])), key=lambda mi: day["meals"][mi]["macros"]["K"])
-            for k in ("P","C","F","K"): day["meals"][m_idx]["macros"][k]+=cand["macros"][k]
-            extras.append({"type":"rte","ref":cand,"day":di,"meal":m_idx})
-            headroom -= cand["price"]
-            day["total_protein"]=sum(m["macros"]["P"] for m in day["meals"])
-            day["total_calories"]=sum(m["macros"]["K"] for m in day["meals"])
-            changed=True
-
+        j = best_filler(frontier, day.K, target_K, headroom)
+        if j is None: reason="nothing_affordable"; break
+        cand = frontier["items"][j]
+        add_item_to_lightest(day, cand, extras, i_min); added+=1
+        headroom -= cand["price"]
+        heapq.heapreplace(heap, (day.K, i_min))
+
+    metrics.EXTRAS_ADDED.inc(added, stage="top_up")
+    metrics.LOOP_EXITS.inc(1, loop="top_up", reason=reason)
     return days_plan, extras, headroom
 
 # ---------------- groceries ----------------
 def groceries_from_plan(base_items, extras, household=1):
-    by_aisle=defaultdict(list); csv_rows=[]; queries=[]
+    # one plan's list; grocery_order.GroceryOrder merges many plans into a group order
+    by_aisle=defaultdict(list); csv_rows=[]
     counter={}
-    def add(name, aisle, package, price, P, K, query):
-        key=(name,aisle,package)
-        counter[key]=counter.get(key,0)+household
-        queries.append(query)
-
     for ch in base_items:
+        r=ch["ref"]
         if ch["type"]=="rte":
-            r=ch["ref"]; add(r["name"], r["aisle"], r["package"], r["price"], r["macros"]["P"], r["macros"]["K"], r.get("insta_query", r["name"]))
+            key=(r["name"], r["aisle"], r["package"]); counter[key]=counter.get(key,0)+household
         else:
-            r=ch["ref"]
-            for ing in r["ingredients"][:4]:
-                add(f"{ing} ({r['title']})", r.get("aisles",["Center Aisle"])[0], "varies", r["price_per_serv"]/2, r["macros"]["P"], r["macros"]["K"], ing)
-
+            aisle=r.get("aisles",["Center Aisle"])[0]
+            for name, _ in recipe_lines(r):
+                key=(name, aisle, "varies"); counter[key]=counter.get(key,0)+household
     for ex in extras:
-        r=ex["ref"]; add(r["name"], r["aisle"], r["package"], r["price"], r["macros"]["P"], r["macros"]["K"], r.get("insta_query", r["name"]))
+        r=ex["ref"]; key=(r["name"], r["aisle"], r["package"]); counter[key]=counter.get(key,0)+household
 
     for (name,aisle,package),qty in counter.items():
-        by_aisle[aisle].append({"name":name,"package":package,"instacart_url":instacart_search_url(name)})
+        by_aisle[aisle].append({"name":name,"package":package,"instacart_url":go_path(name)})
         csv_rows.append({"name":name,"aisle":aisle,"qty":qty,"unit":package})
-    return by_aisle, csv_rows, "\\n".join(queries)
-
-# ---------------- globals ----------------
-LAST_META={}
-LAST_DAYS=[]
-LAST_CSV=[]
-LAST_GROCERY={}
-LAST_BASE=[]
-LAST_EXTRAS=[]
-LAST_COST=0.0
-LAST_PREFS={}
-
-# ---------------- routes ----------------
-@app.route("/")
-def index():
-    return render_template("index.html", APP_NAME=config.APP_NAME, BRAND_NAME=config.BRAND_NAME, FAVICON=config.FAVICON, ACCENT=getattr(config, "ACCENT", "#f97316"), now=datetime.datetime.utcnow())
-
-@app.route("/plan", methods=["POST"])
-def plan():
-    goal=request.form.get("goal","Fat loss")
-    bodyweight=float(request.form.get("bodyweight","185") or 185)
-    calories_str=request.form.get("calories","").strip()
-    meals_per_day=int(request.form.get("meals_per_day","4"))
-    budget=float(request.form.get("budget","180"))
-    time_per_cook=int(request.form.get("time_per_cook","10"))
-    low_carb = request.form.get("low_carb") == "on"
+    return by_aisle, csv_rows
+
+# ---------------- pipeline ----------------
+def parse_plan_form(form):
+    goal=form.get("goal","Fat loss")
+    bodyweight=float(form.get("bodyweight","185") or 185)
+    calories_str=(form.get("calories","") or "").strip()
+    meals_per_day=int(form.get("meals_per_day","4"))
+    budget=float(form.get("budget","180"))
+    time_per_cook=int(form.get("time_per_cook","10"))
+    low_carb = form.get("low_carb") == "on"
     # New inputs
-    age=int(request.form.get("age","35") or 35)
-    activity=request.form.get("activity_level","moderate")
-    height_ft=request.form.get("height_ft","5")
-    height_in=request.form.get("height_in","10")
-    height_cm=request.form.get("height_cm","")
-    sex = request.form.get("sex","neutral")  # optional
+    age=int(form.get("age","35") or 35)
+    activity=form.get("activity_level","moderate")
+    height_ft=form.get("height_ft","5")
+    height_in=form.get("height_in","10")
+    height_cm=form.get("height_cm","")
+    sex = form.get("sex","neutral")  # optional
+    weeks=max(1, min(int(form.get("weeks","1") or 1), int(getattr(config, "PLAN_MAX_WEEKS", 12))))
 
     # Compute height in cm (support US or direct cm)
     if height_cm:
@@ -390,16 +354,48 @@ def plan():
             ft, inch = 5.0, 10.0
         H_cm = (ft*12.0 + inch) * 2.54
 
+    calories=int(calories_str) if calories_str else None
+    check_plan_inputs(meals_per_day=meals_per_day, budget=budget, bodyweight=bodyweight, calories=calories,
+                      age=age, time_per_cook=time_per_cook, height_cm=H_cm)
+
+    # Optional input quantization so near-identical profiles share a cached plan
+    q=getattr(config, "PLAN_CACHE_QUANTIZE", {}) or {}
+    if q.get("bodyweight"):
+        bodyweight=round(bodyweight/q["bodyweight"])*q["bodyweight"]
+    if q.get("calories") and calories is not None:
+        calories=int(round(calories/q["calories"])*q["calories"])
+
+    return {"goal":goal,"bodyweight":bodyweight,"calories":calories,"meals_per_day":meals_per_day,"budget":budget,
+            "time_per_cook":time_per_cook,"low_carb":low_carb,"age":age,"activity":activity,"height_cm":H_cm,"sex":sex,"weeks":weeks}
+
+def check_plan_inputs(**values):
+    # the pipeline divides by meals, calories and bodyweight-derived targets, so out-of-range values are input errors
+    bounds=getattr(config, "PLAN_INPUT_BOUNDS", {}) or {}
+    for name, v in values.items():
+        if v is None or name not in bounds: continue
+        lo, hi = bounds[name]
+        if not lo <= v <= hi:
+            raise ValueError(f"{name} must be between {lo} and {hi}")
+
+def plan_form_from_inputs(inp):
+    """/plan form fields that parse_plan_form turns back into inp."""
+    return {"goal":inp["goal"],"bodyweight":repr(float(inp["bodyweight"])),"calories":"" if inp["calories"] is None else str(inp["calories"]),
+            "meals_per_day":str(inp["meals_per_day"]),"budget":repr(float(inp["budget"])),"time_per_cook":str(inp["time_per_cook"]),
+            "low_carb":"on" if inp["low_carb"] else "","age":str(inp["age"]),"activity_level":inp["activity"],
+            "height_cm":repr(float(inp["height_cm"])),"sex":inp["sex"],"weeks":str(inp.get("weeks", 1))}
+
+def plan_target(inp):
+    bodyweight=inp["bodyweight"]; low_carb=inp["low_carb"]
     # Shares
     shares = {"P":0.45,"C":0.20,"F":0.35} if low_carb else {"P":0.40,"C":0.30,"F":0.30}
 
     # Calories from user or BMR/TDEE if blank
-    if calories_str:
-        calories=int(calories_str)
+    if inp["calories"] is not None:
+        calories=inp["calories"]
         bmr=None; raw_tdee=None
     else:
-        bmr = int(round(mifflin_bmr(bodyweight, H_cm, age, sex=sex)))
-        calories, raw_tdee = tdee_from_bmr_goal(bmr, goal, activity)
+        bmr = int(round(mifflin_bmr(bodyweight, inp["height_cm"], inp["age"], sex=inp["sex"])))
+        calories, raw_tdee = tdee_from_bmr_goal(bmr, inp["goal"], inp["activity"])
 
     # --- STRICT PROTEIN RULES ---
     protein_target = int(round(bodyweight))                 # 1.0 g/lb
@@ -407,148 +403,584 @@ def plan():
     fat_g=int(shares["F"]*calories/9)
     carb_g=int(shares["C"]*calories/4)
     target={"calories":calories,"protein_g":protein_target,"protein_cap":protein_cap,"fat_g":fat_g,"carb_g":carb_g,"shares":shares}
-
+    return target, {"bmr":bmr,"tdee":raw_tdee}
+
+def solver_settings(solver=None):
+    # (enabled, deadline in ms); None means use the config default
+    on = getattr(config, "PLAN_SOLVER", False) if solver is None else bool(solver)
+    return (on, int(getattr(config, "PLAN_SOLVER_DEADLINE_MS", 50)) if on else 0)
+
+def plan_penalty(days_plan, target):
+    protein_target=int(target["protein_g"])
+    return sum(day_penalty(*d.totals(), int(target["calories"]), protein_target, target["shares"],
+                           protein_cap=int(target.get("protein_cap", protein_target))) for d in days_plan)
+
+# Pipeline stages in order; each one's cache key chains its own inputs onto the previous key, so a
+# change only invalidates the stages from the first one that reads the changed field.
+PLAN_STAGES = ("choose","week","balance_1","budget","balance_2","solver")
+
+STAGE_CACHE = PlanCache(getattr(config, "PLAN_STAGE_CACHE_SIZE", 1024), getattr(config, "PLAN_STAGE_CACHE_TTL", 3600))
+
+def plan_stage_keys(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days=7, solver=None):
+    calories=target["calories"]; s=target["shares"]
+    protein_target=int(target["protein_g"])
+    own={
+        "choose":(catalog.version, int(calories/meals_per_day), int(meals_per_day)*int(days), int(time_per_cook) > 10, bool(low_carb)),
+        "week":(int(meals_per_day), int(days)),
+        "balance_1":(int(calories), protein_target, int(target.get("protein_cap", protein_target)), (s["P"], s["C"], s["F"])),
+        "budget":(float(budget),),
+        "balance_2":(),
+        "solver":solver_settings(solver) + (getattr(config, "PLAN_SOLVER_MAX_COPIES", 3),),
+    }
+    keys={}; prev=""
+    for name in PLAN_STAGES:
+        prev=hashlib.sha1(repr((prev, name, own[name])).encode()).hexdigest()
+        keys[name]=prev
+    return keys
+
+def stage_snapshot(chosen, days_plan, extras, report):
+    # copies on the way in and out: later stages mutate days and extras in place
+    return {"chosen":chosen, "days":None if days_plan is None else [d.copy() for d in days_plan],
+            "extras":None if extras is None else extras.copy(), "report":report}
+
+def resume_plan(keys, last):
+    """(stages already done, snapshot) for the deepest cached stage up to PLAN_STAGES[last]."""
+    if keys is not None:
+        for i in range(last, -1, -1):
+            hit=STAGE_CACHE.get(keys[PLAN_STAGES[i]])
+            if hit is not None:
+                metrics.PLAN_RESUMES.inc(stage=PLAN_STAGES[i])
+                return i+1, stage_snapshot(hit["chosen"], hit["days"], hit["extras"], hit["report"])
+    return 0, {"chosen":None, "days":None, "extras":None, "report":None}
+
+def build_plan(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days=7, solver=None, variant=None, reuse_stages=True):
+    calories=target["calories"]
     per_meal_k=int(calories/meals_per_day)
-    catalog=load_catalog()
-
-    days=7
     total_meals=meals_per_day*days
-    chosen=choose_items(catalog, total_meals, time_per_cook, per_meal_k, low_carb)
-    days_plan, extras=build_week_plan(chosen, meals_per_day, days, per_meal_k, catalog, low_carb)
-    days_plan, extras=balance_macros_for_week(days_plan, target, catalog, extras, low_carb)
-
-    cost=sum((item_price(it) for it in chosen)) + sum((e["ref"]["price"] for e in extras))
-    if cost>budget:
-        extras.sort(key=lambda e: float(e["ref"]["price"]), reverse=True)
-        for ex in list(extras):
-            if cost<=budget: break
-            d=ex.get("day",0); m=ex.get("meal",0)
-            if d<len(days_plan) and m<len(days_plan[d]["meals"]):
-                meal=days_plan[d]["meals"][m]
-                for k in ("P","C","F","K"):
-                    meal["macros"][k]=max(0, meal["macros"][k]-ex["ref"]["macros"][k])
-            cost-=float(ex["ref"]["price"]); extras.remove(ex)
-        for d in days_plan:
-            d["total_protein"]=sum(m["macros"]["P"] for m in d["meals"])
-            d["total_calories"]=sum(m["macros"]["K"] for m in d["meals"])
-
-    days_plan, extras, _ = top_up_days_with_budget(days_plan, extras, catalog, target, cost, budget, low_carb)
-    days_plan, extras = balance_macros_for_week(days_plan, target, catalog, extras, low_carb)
-
-    grocery, csv_rows, queries = groceries_from_plan(chosen, extras, household=1)
+    rng=None; noise=0.0
+    if variant is not None:
+        # (seed, jitter): perturbed selection for randomized restarts; balancing still aims at the real target
+        seed, jitter = variant
+        rng=random.Random(seed); noise=jitter
+        per_meal_k=int(per_meal_k * (1 + rng.uniform(-jitter, jitter)))
+    use_solver, deadline_ms = solver_settings(solver)
+    # restart variants are random, so only the plain pipeline reads or fills the stage cache
+    keys=None
+    if reuse_stages and variant is None and STAGE_CACHE.maxsize:
+        keys=plan_stage_keys(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days, solver)
+    done, snap=resume_plan(keys, PLAN_STAGES.index("solver" if use_solver else "balance_2"))
+    chosen, days_plan, extras, report = snap["chosen"], snap["days"], snap["extras"], snap["report"]
+
+    def save(name):
+        if keys is not None:
+            STAGE_CACHE.put(keys[name], stage_snapshot(chosen, days_plan, extras, report))
+
+    if done < 1:
+        with stage("choose_items"):
+            chosen=choose_items(catalog, total_meals, time_per_cook, per_meal_k, low_carb, rng=rng, noise=noise)
+        save("choose")
+    if done < 2:
+        with stage("build_week"):
+            days_plan, extras=build_week_plan(chosen, meals_per_day, days, per_meal_k, catalog, low_carb)
+        save("week")
+    if done < 3:
+        with stage("balance_1"):
+            days_plan, extras=balance_macros_for_week(days_plan, target, catalog, extras, low_carb, pass_name="balance_1")
+        save("balance_1")
+
+    if done < 4:
+        with stage("budget_trim"):
+            cost=sum((item_price(it) for it in chosen)) + sum((e["ref"]["price"] for e in extras))
+            trimmed=0
+            if cost>budget:
+                extras.sort(key=lambda e: float(e["ref"]["price"]), reverse=True)
+                for ex in list(extras):
+                    if cost<=budget: break
+                    d=ex.get("day",0); m=ex.get("meal",0)
+                    if d<len(days_plan) and m<len(days_plan[d].meals):
+                        days_plan[d].remove(m, ex["ref"]["macros"])
+                    cost-=float(ex["ref"]["price"]); extras.remove(ex); trimmed+=1
+            metrics.EXTRAS_REMOVED.inc(trimmed, stage="budget_trim")
+
+        with stage("top_up"):
+            days_plan, extras, _ = top_up_days_with_budget(days_plan, extras, catalog, target, cost, budget, low_carb)
+        save("budget")
+    if done < 5:
+        with stage("balance_2"):
+            days_plan, extras = balance_macros_for_week(days_plan, target, catalog, extras, low_carb, pass_name="balance_2")
+        save("balance_2")
+
+    if use_solver and done < 6:
+        cost=sum((item_price(it) for it in chosen)) + sum((e["ref"]["price"] for e in extras))
+        with stage("solver"):
+            report=improve_week(days_plan, extras, catalog.view(low_carb)["solver_pool"], target, cost, budget,
+                                day_penalty_vec, add_item_to_lightest, deadline_ms=deadline_ms,
+                                max_copies=getattr(config, "PLAN_SOLVER_MAX_COPIES", 3))
+        save("solver")
+
+    with stage("groceries"):
+        grocery, csv_rows = groceries_from_plan(chosen, extras, household=1)
     total_cost = sum((item_price(it) for it in chosen)) + sum((e["ref"]["price"] for e in extras))
+    return {"chosen":chosen,"days":[d.to_dict() for d in days_plan],"extras":list(extras),"grocery":grocery,
+            "csv_rows":csv_rows,"total_cost":total_cost,"solver":report,
+            "penalty":plan_penalty(days_plan, target)}
+
+PLAN_CACHE = PlanCache(getattr(config, "PLAN_CACHE_SIZE", 512), getattr(config, "PLAN_CACHE_TTL", 3600),
+                       getattr(config, "PLAN_CACHE_POLICY", "lru"))
+
+def restart_settings(restarts=None):
+    # number of perturbed variants raced against the normal plan; 0 = off
+    n = getattr(config, "PLAN_RESTARTS", 0) if restarts is None else int(restarts)
+    return min(max(0, int(n or 0)), int(getattr(config, "PLAN_RESTARTS_MAX", 16)))
+
+def plan_with_restarts(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days=7, solver=None, restarts=None):
+    n=restart_settings(restarts)
+    baseline=lambda: build_plan(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days, solver)
+    if not n:
+        return baseline()
+    import restarts as _restarts
+    return _restarts.best_of_restarts(baseline, target, meals_per_day, budget, time_per_cook, low_carb, days, solver, n=n,
+                                      workers=getattr(config, "PLAN_RESTARTS_WORKERS", None),
+                                      time_limit_ms=getattr(config, "PLAN_RESTARTS_TIME_MS", 150),
+                                      jitter=getattr(config, "PLAN_RESTARTS_JITTER", 0.08))
+
+def plan_cache_key(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days=7, solver=None, restarts=None):
+    # only inputs the pipeline actually reads; time_per_cook just picks the RTE ratio
+    s=target["shares"]
+    return (catalog.version, int(target["calories"]), int(target["protein_g"]), int(target.get("protein_cap", target["protein_g"])),
+            (s["P"], s["C"], s["F"]), int(meals_per_day), float(budget), int(time_per_cook) > 10, bool(low_carb), int(days),
+            solver_settings(solver), restart_settings(restarts))
+
+def cached_plan(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days=7, solver=None, restarts=None):
+    key=plan_cache_key(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days, solver, restarts)
+    res=PLAN_CACHE.get(key)
+    if res is None:
+        res=plan_with_restarts(target, meals_per_day, budget, time_per_cook, low_carb, catalog, days, solver, restarts)
+        PLAN_CACHE.put(key, res)
+    return res
+
+def week_seed(week):
+    # restart variants use small integer seeds (1, 2, ...); hashing keeps week k from replaying one
+    return int(hashlib.sha1(f"week:{week}".encode()).hexdigest()[:16], 16)
+
+def week_plan(target, meals_per_day, budget, time_per_cook, low_carb, catalog, week=1, solver=None):
+    """Plan for one week (1-based) of a multi-week horizon; week 1 is the regular plan."""
+    jitter=getattr(config, "PLAN_WEEK_JITTER", 0.08)
+    if week==1 or not jitter:
+        return cached_plan(target, meals_per_day, budget, time_per_cook, low_carb, catalog, solver=solver)
+    key=plan_cache_key(target, meals_per_day, budget, time_per_cook, low_carb, catalog, solver=solver) + (("week", week, jitter),)
+    res=PLAN_CACHE.get(key)
+    if res is None:
+        res=build_plan(target, meals_per_day, budget, time_per_cook, low_carb, catalog, solver=solver, variant=(week_seed(week), jitter))
+        PLAN_CACHE.put(key, res)
+    return res
+
+def iter_plan_weeks(target, meals_per_day, budget, time_per_cook, low_carb, catalog, weeks=1, solver=None):
+    # one balanced week at a time: callers render or write each week before the next one is built
+    for week in range(1, weeks+1):
+        yield week, week_plan(target, meals_per_day, budget, time_per_cook, low_carb, catalog, week, solver)
+
+# ---------------- plan store ----------------
+PLAN_STORE = make_plan_store(getattr(config, "PLAN_STORE", "memory"), getattr(config, "PLAN_STORE_PATH", None),
+                             maxsize=getattr(config, "PLAN_STORE_SIZE", 1000), ttl=getattr(config, "PLAN_STORE_TTL", 86400))
+
+def week_record(res):
+    # what the export routes need; Instacart links are minted at export time so they are not stored
+    grocery={aisle:[{"name":it["name"],"package":it["package"]} for it in items] for aisle, items in res["grocery"].items()}
+    return {"days":res["days"],"csv":res["csv_rows"],"grocery":grocery,"cost":res["total_cost"]}
+
+def plan_record(inp, target, meta, res, weeks=None):
+    """days/csv/grocery/cost are week 1; multi-week plans also carry every week_record under "weeks"."""
+    rec={
+        "meta":{"calories":target["calories"],"protein_g":target["protein_g"],"budget":inp["budget"], "bmr":meta["bmr"], "tdee":meta["tdee"],
+                "age":inp["age"],"height_cm":inp["height_cm"],"activity":inp["activity"],"sex":inp["sex"]},
+        **week_record(res),
+        "prefs":{"low_carb":inp["low_carb"]},"inputs":inp,
+    }
+    if weeks:
+        rec["weeks"]=weeks
+    return rec
 
-    global LAST_META, LAST_DAYS, LAST_CSV, LAST_GROCERY, LAST_BASE, LAST_EXTRAS, LAST_COST, LAST_PREFS
-    LAST_META={"calories":calories,"protein_g":protein_target,"budget":budget, "bmr":bmr, "tdee":raw_tdee,
-               "age":age,"height_cm":H_cm,"activity":activity,"sex":sex}
-    LAST_DAYS=days_plan
-    LAST_CSV=csv_rows
-    LAST_GROCERY=grocery
-    LAST_BASE=chosen
-    LAST_EXTRAS=extras
-    LAST_COST=total_cost
-    LAST_PREFS={"low_carb":low_carb}
+# ---------------- routes ----------------
+@app.route("/")
+def index():
+    return render_template("index.html", APP_NAME=config.APP_NAME, BRAND_NAME=config.BRAND_NAME, FAVICON=config.FAVICON, ACCENT=getattr(config, "ACCENT", "#f97316"), now=datetime.datetime.utcnow())
+
+@app.route("/plan", methods=["POST"])
+def plan():
+    try:
+        inp=parse_plan_form(request.form)
+    except (TypeError, ValueError) as e:
+        return f"Invalid input: {e}", 400
+    return plan_page(inp)
+
+@app.route("/plan/<plan_id>/revise", methods=["POST"])
+def revise_plan(plan_id):
+    """A new plan from a stored one with only the posted /plan form fields changed.
+
+    Omitted fields keep their stored values (send low_carb=off to clear it). Cached pipeline
+    stages upstream of the changed fields are reused, so e.g. a budget change starts at the trim.
+    """
+    rec=PLAN_STORE.get(plan_id)
+    if not rec or "inputs" not in rec:
+        return "No plan generated", 404
+    form=plan_form_from_inputs(rec["inputs"])
+    if ("height_ft" in request.form or "height_in" in request.form) and "height_cm" not in request.form:
+        form.pop("height_cm")
+    form.update(request.form.items())
+    try:
+        inp=parse_plan_form(form)
+    except (TypeError, ValueError) as e:
+        return f"Invalid input: {e}", 400
+    return plan_page(inp)
+
+def plan_page(inp):
+    target, meta=plan_target(inp)
+    with stage("catalog_load"):
+        catalog=load_catalog()
+    if inp.get("weeks", 1) > 1:
+        return plan_weeks_page(inp, target, meta, catalog)
+    res=cached_plan(target, inp["meals_per_day"], inp["budget"], inp["time_per_cook"], inp["low_carb"], catalog)
+
+    with stage("store"):
+        rec=plan_record(inp, target, meta, res)
+        plan_id=PLAN_STORE.put(rec)
+    if getattr(config, "PDF_PRERENDER", False):
+        # speculative: most users download at least one PDF right after planning
+        for kind in PDF_FILENAMES:
+            PDF_JOBS.submit(kind, plan_id, rec, link_base())
 
     plan={
-        "days":days_plan,"grocery":grocery,"csv_rows":csv_rows,"queries":queries,
-        "total_cost":total_cost,"calories":calories,"protein_target":protein_target,"budget":budget,
-        "low_carb":low_carb, "bmr":bmr, "tdee":raw_tdee, "age":age, "height_cm":H_cm, "activity":activity, "sex":sex
+        "plan_id":plan_id,
+        "days":res["days"],"grocery":res["grocery"],"csv_rows":res["csv_rows"],
+        "total_cost":res["total_cost"],"calories":target["calories"],"protein_target":target["protein_g"],"budget":inp["budget"],
+        "low_carb":inp["low_carb"], "bmr":meta["bmr"], "tdee":meta["tdee"], "age":inp["age"], "height_cm":inp["height_cm"],
+        "activity":inp["activity"], "sex":inp["sex"]
     }
-    return render_template("plan.html", plan=plan, APP_NAME=config.APP_NAME, BRAND_NAME=config.BRAND_NAME, FAVICON=config.FAVICON, ACCENT=getattr(config,"ACCENT","#f97316"), now=datetime.datetime.utcnow())
+    with stage("render"):
+        return render_template("plan.html", plan=plan, APP_NAME=config.APP_NAME, BRAND_NAME=config.BRAND_NAME, FAVICON=config.FAVICON, ACCENT=getattr(config,"ACCENT","#f97316"), now=datetime.datetime.utcnow())
+
+def plan_weeks_page(inp, target, meta, catalog):
+    """Multi-week plan page, streamed: each week is built, balanced and sent before the next one starts.
+
+    The plan is stored once the last week is out; the export links come after it on the page.
+    """
+    plan_id=new_plan_id(); base=link_base()
+    args=(target, inp["meals_per_day"], inp["budget"], inp["time_per_cook"], inp["low_carb"], catalog, inp["weeks"])
+    def weeks():
+        first=None; records=[]
+        for n, res in iter_plan_weeks(*args):
+            first=first or res
+            records.append(week_record(res))
+            yield {"n":n, "days":res["days"], "grocery":res["grocery"], "total_cost":res["total_cost"]}
+        rec=plan_record(inp, target, meta, first, records)
+        PLAN_STORE.put(rec, plan_id)
+        if getattr(config, "PDF_PRERENDER", False):
+            for kind in PDF_FILENAMES:
+                PDF_JOBS.submit(kind, plan_id, rec, base)
+    plan={
+        "plan_id":plan_id, "weeks":inp["weeks"],
+        "calories":target["calories"],"protein_target":target["protein_g"],"budget":inp["budget"],
+        "low_carb":inp["low_carb"], "bmr":meta["bmr"], "tdee":meta["tdee"],
+    }
+    html=stream_template("plan_weeks.html", plan=plan, weeks=weeks(), APP_NAME=config.APP_NAME, BRAND_NAME=config.BRAND_NAME,
+                         FAVICON=config.FAVICON, ACCENT=getattr(config,"ACCENT","#f97316"), now=datetime.datetime.utcnow())
+    return app.response_class(coalesce(html))
+
+def coalesce(chunks, size=4096):
+    # Jinja yields one small string per template event; send them in a few KB at a time instead
+    buf=[]; n=0
+    for chunk in chunks:
+        buf.append(chunk); n+=len(chunk)
+        if n>=size:
+            yield "".join(buf); buf=[]; n=0
+    if buf:
+        yield "".join(buf)
 
 # -------- Exports --------
-@app.route("/export/csv")
-def export_csv():
-    if not LAST_CSV: return "No plan generated", 400
+def csv_lines(header, rows):
+    # one encoded line at a time, so long plans never build the whole file in memory
     import csv
-    buf=io.StringIO()
-    w=csv.writer(buf)
-    w.writerow(["Item","Aisle","Qty","Unit"])
-    for r in LAST_CSV:
-        w.writerow([r["name"], r["aisle"], r["qty"], r["unit"]])
-    buf.seek(0)
-    return app.response_class(buf.getvalue(), mimetype="text/csv", headers={"Content-Disposition":"attachment; filename=grocery.csv"})
-
-def wrapped_paragraph(text, style):
-    text = text.replace("&", "&amp;").replace("<","&lt;").replace(">","&gt;")
-    return Paragraph(text, style)
-
-def link_paragraph(url, text, style):
-    return Paragraph(f'<link href="{url}">{text}</link>', style)
-
-@app.route("/export/plan.pdf")
-def export_plan_pdf():
-    if not LAST_DAYS: return "No plan generated", 400
-    buff=io.BytesIO()
-    doc=SimpleDocTemplate(buff, pagesize=letter, title="Meal Plan", leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
-    styles=getSampleStyleSheet()
-    title = styles["Title"]; title.fontName="Helvetica-Bold"; title.fontSize=19
-    h3 = styles["Heading3"]; h3.fontName="Helvetica-Bold"; h3.fontSize=12
-    body = ParagraphStyle("body", parent=styles["Normal"], fontName="Helvetica", fontSize=10, leading=12, wordWrap='LTR')
-    elems=[wrapped_paragraph("ActivBlaze Corporate Cut — 7-Day Plan", title)]
-    meta_line = f"Calories/day target: {LAST_META.get('calories')}"
-    if LAST_META.get("bmr") and LAST_META.get("tdee"):
-        meta_line += f" • BMR: {LAST_META.get('bmr')} • TDEE: {LAST_META.get('tdee')}"
-    meta_line += f" • Protein target: {LAST_META.get('protein_g')} g • Budget: ${LAST_META.get('budget')} • Diet: {'Low-carb' if LAST_PREFS.get('low_carb') else 'Standard 40/30/30'}"
-    elems += [wrapped_paragraph(meta_line, body), Spacer(1,10)]
-    zebra=[colors.whitesmoke, colors.HexColor('#eef2ff')]
-    for i, day in enumerate(LAST_DAYS, start=1):
-        elems.append(wrapped_paragraph(f"Day {i} — {day.get('total_protein',0)} g protein, ~{int(day.get('total_calories',0))} kcal", h3))
-        data=[["Meal","P","C","F","K"]]
-        for m in day["meals"]:
-            mc=m["macros"]
-            data.append([wrapped_paragraph(m["title"], body), mc["P"], mc["C"], mc["F"], mc["K"]])
-        t=Table(data, repeatRows=1, colWidths=[320,45,45,45,55])
-        t.setStyle(TableStyle([
-            ('FONT',(0,0),(-1,-1),'Helvetica'),
-            ('BACKGROUND',(0,0),(-1,0),colors.black),
-            ('TEXTCOLOR',(0,0),(-1,0),colors.white),
-            ('VALIGN',(0,0),(-1,-1),'TOP'),
-            ('ALIGN',(1,1),(-1,-1),'RIGHT'),
-            ('GRID',(0,0),(-1,-1),0.25,colors.grey),
-        ]))
-        for r in range(1, len(data)):
-            t.setStyle(TableStyle([('BACKGROUND',(0,r),(-1,r), zebra[r%2])]))
-        elems.extend([t, Spacer(1,10)])
-    doc.build(elems)
-    pdf=buff.getvalue(); buff.close()
-    return app.response_class(pdf, mimetype="application/pdf", headers={"Content-Disposition":"attachment; filename=plan.pdf"})
-
-@app.route("/export/grocery.pdf")
-def export_grocery_pdf():
-    if not LAST_GROCERY: return "No plan generated", 400
-    buff=io.BytesIO()
-    doc=SimpleDocTemplate(buff, pagesize=letter, title="Grocery List", leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
-    styles=getSampleStyleSheet()
-    title = ParagraphStyle("t", parent=styles["Title"], fontName="Helvetica-Bold", fontSize=19)
-    h3 = ParagraphStyle("h3", parent=styles["Heading3"], fontName="Helvetica-Bold", fontSize=12)
-    body = ParagraphStyle("body", parent=styles["Normal"], fontName="Helvetica", fontSize=10, leading=12, wordWrap='LTR')
-    elems=[wrapped_paragraph("ActivBlaze Corporate Cut — Grocery List", title), Spacer(1,8)]
-    total=LAST_COST
-    for aisle, items in LAST_GROCERY.items():
-        elems.append(wrapped_paragraph(aisle, h3))
-        data=[["Item","Package","Instacart"]]
-        for it in items:
-            data.append([wrapped_paragraph(it["name"], body), wrapped_paragraph(it["package"], body), link_paragraph(instacart_search_url(it["name"]), "Open in Instacart", body)])
-        t=Table(data, repeatRows=1, colWidths=[300,100,160])
-        t.setStyle(TableStyle([
-            ('FONT',(0,0),(-1,-1),'Helvetica'),
-            ('BACKGROUND',(0,0),(-1,0),colors.black),
-            ('TEXTCOLOR',(0,0),(-1,0),colors.white),
-            ('VALIGN',(0,0),(-1,-1),'TOP'),
-            ('GRID',(0,0),(-1,-1),0.25,colors.grey),
-        ]))
-        for r in range(1, len(data)):
-            t.setStyle(TableStyle([('BACKGROUND',(0,r),(-1,r), colors.whitesmoke if r%2==0 else colors.HexColor('#f1f5f9'))]))
-        elems.extend([t, Spacer(1,6)])
-    elems.append(wrapped_paragraph(f"Estimated Weekly Total: ${total:.2f}", h3))
-    doc.build(elems)
-    pdf=buff.getvalue(); buff.close()
-    return app.response_class(pdf, mimetype="application/pdf", headers={"Content-Disposition":"attachment; filename=grocery.pdf"})
+    buf=io.StringIO(); w=csv.writer(buf)
+    for row in itertools.chain([header], rows):
+        w.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0); buf.truncate()
+
+@app.route("/export/<plan_id>/csv")
+def export_csv(plan_id):
+    rec=PLAN_STORE.get(plan_id)
+    if not rec or not rec["csv"]: return "No plan generated", 404
+    if rec.get("weeks"):
+        lines=csv_lines(["Week","Item","Aisle","Qty","Unit"],
+                        ([n, r["name"], r["aisle"], r["qty"], r["unit"]] for n, wk in enumerate(rec["weeks"], start=1) for r in wk["csv"]))
+    else:
+        lines=csv_lines(["Item","Aisle","Qty","Unit"], ([r["name"], r["aisle"], r["qty"], r["unit"]] for r in rec["csv"]))
+    return app.response_class(lines, mimetype="text/csv", headers={"Content-Disposition":"attachment; filename=grocery.csv"})
+
+PDF_CACHE = PdfCache(getattr(config, "PDF_CACHE_BYTES", 64*1024*1024))
+
+PDF_JOBS = PdfJobQueue(PDF_CACHE, workers=getattr(config, "PDF_POOL_WORKERS", 2), max_pending=getattr(config, "PDF_QUEUE_MAX", 32))
+PDF_FILENAMES = {"plan":"plan.pdf","grocery":"grocery.pdf"}
+
+def send_pdf(kind, entry):
+    etag, pdf = entry
+    resp=app.response_class(pdf, mimetype="application/pdf", headers={"Content-Disposition":f"attachment; filename={PDF_FILENAMES[kind]}"})
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"]="private, no-cache"
+    return resp.make_conditional(request)
+
+def link_base():
+    # PDFs are read outside the site, so their /go/ links need an absolute origin
+    return (getattr(config, "PUBLIC_BASE_URL", None) or request.host_url).rstrip("/")
+
+def enqueue_pdf(kind, plan_id, rec):
+    state=PDF_JOBS.submit(kind, plan_id, rec, link_base())
+    job_id=PDF_JOBS.job_id(kind, plan_id)
+    if state=="full":
+        resp=jsonify({"job_id":job_id,"status":"busy"}); resp.status_code=503
+        resp.headers["Retry-After"]="2"
+        return resp
+    resp=jsonify({"job_id":job_id,"status":state,"status_url":f"/export/jobs/{job_id}"})
+    resp.status_code=202
+    resp.headers["Location"]=f"/export/jobs/{job_id}"
+    resp.headers["Retry-After"]="1"
+    return resp
+
+def pdf_response(kind, plan_id, rec):
+    # plan ids are immutable, so (kind, plan_id, link base) identifies one document version
+    key=document_key(kind, plan_id, link_base())
+    entry=PDF_CACHE.get(key)
+    if entry is None and (getattr(config, "PDF_ASYNC", False) or request.args.get("async")=="1"):
+        return enqueue_pdf(kind, plan_id, rec)
+    if entry is None:
+        with stage(f"pdf_{kind}"):
+            entry=PDF_CACHE.put(key, render_document(kind, rec, link_base()))
+    return send_pdf(kind, entry)
+
+@app.route("/export/<plan_id>/plan.pdf")
+def export_plan_pdf(plan_id):
+    rec=PLAN_STORE.get(plan_id)
+    if not rec or not rec["days"]: return "No plan generated", 404
+    return pdf_response("plan", plan_id, rec)
+
+@app.route("/export/<plan_id>/grocery.pdf")
+def export_grocery_pdf(plan_id):
+    rec=PLAN_STORE.get(plan_id)
+    if not rec or not rec["grocery"]: return "No plan generated", 404
+    return pdf_response("grocery", plan_id, rec)
+
+@app.route("/export/jobs/<job_id>")
+def export_job(job_id):
+    kind, plan_id = PDF_JOBS.parse_job_id(job_id)
+    if kind not in PDF_FILENAMES: return "Unknown job", 404
+    state, detail = PDF_JOBS.status(kind, plan_id, link_base())
+    if state=="done":
+        return send_pdf(kind, detail)
+    if state=="error":
+        resp=jsonify({"job_id":job_id,"status":"error","error":detail}); resp.status_code=500
+        return resp
+    if state is None:
+        # job ran on another worker (or was evicted); restart it here if the plan still exists
+        rec=PLAN_STORE.get(plan_id)
+        if not rec: return "Unknown job", 404
+        return enqueue_pdf(kind, plan_id, rec)
+    resp=jsonify({"job_id":job_id,"status":"pending","queue":PDF_JOBS.queue_length()}); resp.status_code=202
+    resp.headers["Retry-After"]="1"
+    return resp
+
+# -------- JSON API --------
+API_FIELDS = ("targets","days","grocery","total_cost","budget","low_carb","instacart","plan_id","solver","restarts")
+
+def api_document(inp, target, meta, res):
+    # grocery keeps only the cleaned Instacart query; clients add search ids when they build the link
+    grocery=defaultdict(list)
+    for r in res["csv_rows"]:
+        grocery[r["aisle"]].append({"name":r["name"],"package":r["unit"],"qty":r["qty"],"q":clean_query(r["name"])})
+    return {
+        "targets":{"calories":target["calories"],"protein_g":target["protein_g"],"protein_cap":target["protein_cap"],
+                   "fat_g":target["fat_g"],"carb_g":target["carb_g"],"shares":target["shares"],"bmr":meta["bmr"],"tdee":meta["tdee"]},
+        "days":res["days"],
+        "grocery":grocery,
+        "total_cost":round(res["total_cost"], 2),
+        "budget":inp["budget"],
+        "low_carb":inp["low_carb"],
+        "instacart":{"search_url":"https://www.instacart.com/store/s?k=","utm_campaign":getattr(config,"UTM_CAMPAIGN","corporate-cut")},
+    }
+
+def json_response(doc):
+    body=json.dumps(doc, separators=(",",":")).encode("utf-8")
+    etag=hashlib.sha1(body).hexdigest()
+    headers={"Vary":"Accept-Encoding","Cache-Control":f"public, max-age={getattr(config, 'API_CACHE_MAX_AGE', 300)}"}
+    if len(body) >= 1024 and "gzip" in request.headers.get("Accept-Encoding",""):
+        body=gzip.compress(body, 6, mtime=0)
+        headers["Content-Encoding"]="gzip"
+        etag+="-gz"   # strong validators must differ per encoding
+    resp=app.response_class(body, mimetype="application/json", headers=headers)
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+@app.route("/api/plan", methods=["GET","POST"])
+def api_plan():
+    if request.method=="GET":
+        form=request.args
+    elif request.is_json:
+        import bulk
+        form=bulk.form_from_profile(request.get_json(silent=True) or {})
+    else:
+        form=request.form
+    try:
+        inp=parse_plan_form(form)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error":f"invalid input: {e}"}), 400
+    target, meta=plan_target(inp)
+    solver={"1":True,"0":False}.get(request.args.get("solver"))
+    restarts=request.args.get("restarts", type=int)
+    res=cached_plan(target, inp["meals_per_day"], inp["budget"], inp["time_per_cook"], inp["low_carb"], load_catalog(),
+                    solver=solver, restarts=restarts)
+    doc=api_document(inp, target, meta, res)
+    for k in ("solver","restarts"):
+        if res.get(k):
+            doc[k]=res[k]
+    if request.values.get("export")=="1":
+        # opt-in: store the plan so /export/<plan_id>/... works (makes the response per-user)
+        doc["plan_id"]=PLAN_STORE.put(plan_record(inp, target, meta, res))
+    fields=request.args.get("fields")
+    if fields:
+        keep={f.strip() for f in fields.split(",")} & set(API_FIELDS)
+        doc={k:v for k,v in doc.items() if k in keep}
+    resp=json_response(doc)
+    if "plan_id" in doc:
+        resp.headers["Cache-Control"]="private, no-store"
+    return resp
+
+# -------- Bulk --------
+def bulk_pool_args():
+    # ?workers= and ?chunk= can only go below the configured limits: each request builds its own pool
+    max_workers=max(1, int(getattr(config, "BULK_WORKERS", None) or os.cpu_count() or 1))
+    workers=min(max(1, request.args.get("workers", type=int) or max_workers), max_workers)
+    chunk=request.args.get("chunk", type=int) or getattr(config, "BULK_CHUNK_SIZE", 8)
+    return workers, min(max(1, chunk), max(1, int(getattr(config, "BULK_MAX_CHUNK_SIZE", 64))))
+
+@app.route("/bulk/plan", methods=["POST"])
+def bulk_plan():
+    import bulk
+    workers, chunk = bulk_pool_args()
+    ordered=request.args.get("ordered", "1") != "0"
+    pairs=itertools.islice(bulk.read_profiles(request.stream), getattr(config, "BULK_MAX_PROFILES", 5000))
+    rows=bulk.iter_bulk_plans(pairs, workers, chunk, ordered)
+    return app.response_class(stream_with_context(bulk.to_ndjson(rows)), mimetype="application/x-ndjson")
+
+@app.route("/bulk/order", methods=["POST"])
+def bulk_order():
+    """JSONL profiles in, one merged group grocery order out (?format=csv, the default, or pdf)."""
+    import bulk
+    from grocery_order import GroceryOrder
+    fmt=request.args.get("format", "csv")
+    if fmt not in ("csv", "pdf"): return "format must be csv or pdf", 400
+    workers, chunk = bulk_pool_args()
+    pairs=itertools.islice(bulk.read_profiles(request.stream), getattr(config, "BULK_MAX_PROFILES", 5000))
+    order=GroceryOrder(); errors=0
+    for row in bulk.fold_order(bulk.iter_bulk_plans(pairs, workers, chunk, ordered=False, order_lines=True), order):
+        errors+=("error" in row)
+    headers={"X-Plans":str(order.plans), "X-Plan-Errors":str(errors)}
+    if fmt=="pdf":
+        with stage("pdf_order"):
+            pdf=order.to_pdf(link_base())
+        headers["Content-Disposition"]="attachment; filename=group_order.pdf"
+        return app.response_class(pdf, mimetype="application/pdf", headers=headers)
+    headers["Content-Disposition"]="attachment; filename=group_order.csv"
+    return app.response_class(order.to_csv(), mimetype="text/csv", headers=headers)
+
+@app.route("/go/<token>")
+def go(token):
+    # search/page-view ids are minted per click, so this must never be cached. Tokens are
+    # registered by the catalog load, which a fresh worker may not have done yet.
+    load_catalog()
+    url=resolve_link(token)
+    if url is None: return "Link expired", 404
+    resp=redirect(url, 302)
+    resp.headers["Cache-Control"]="no-store"
+    return resp
 
 @app.route("/healthz")
 def healthz():
     return "ok", 200
 
+# ---------------- Instrumentation ----------------
+PROFILES = metrics.ProfileStore(getattr(config, "PROFILE_KEEP", 20))
+
+@app.before_request
+def start_timing():
+    metrics.begin_request()
+    request.environ["planner.t0"] = time.perf_counter()
+    if getattr(config, "PROFILING_ENABLED", False) and request.args.get("profile")=="1":
+        request.environ["planner.profiler"] = metrics.SamplingProfiler(
+            interval=getattr(config, "PROFILE_INTERVAL_MS", 2)/1000.0).start()
+
+@app.after_request
+def server_timing(resp):
+    t0 = request.environ.get("planner.t0")
+    if t0 is None:
+        return resp
+    total = time.perf_counter() - t0
+    metrics.REQUEST_SECONDS.observe(total, endpoint=request.endpoint or "unmatched")
+    if getattr(config, "SERVER_TIMING", True):
+        resp.headers["Server-Timing"] = metrics.server_timing(metrics.end_request(), total)
+    profiler = request.environ.pop("planner.profiler", None)
+    if profiler is not None:
+        profile_id = uuid.uuid4().hex
+        PROFILES.put(profile_id, profiler.stop())
+        resp.headers["X-Profile-Id"] = profile_id
+    return resp
+
+@app.route("/metrics")
+def metrics_endpoint():
+    plan_cache = PLAN_CACHE.stats()
+    gauges = [
+        ("planner_plan_cache_entries", "Plans held in the in-process plan cache.", {(): plan_cache["size"]}),
+        ("planner_plan_cache_events", "Plan cache hits/misses/evictions/expirations since start.",
+         {(("event", k),): plan_cache[k] for k in ("hits","misses","evictions","expired")}),
+        ("planner_stage_cache_entries", "Stage snapshots held for incremental re-planning.", {(): STAGE_CACHE.stats()["size"]}),
+        ("planner_pdf_cache_bytes", "Bytes held by the rendered PDF cache.", {(): PDF_CACHE.bytes}),
+        ("planner_pdf_cache_events", "PDF cache hits/misses/evictions since start.",
+         {(("event", "hits"),): PDF_CACHE.hits, (("event", "misses"),): PDF_CACHE.misses, (("event", "evictions"),): PDF_CACHE.evictions}),
+        ("planner_pdf_queue_length", "PDF render jobs pending in this worker.", {(): PDF_JOBS.queue_length()}),
+    ]
+    return app.response_class(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+@app.route("/debug/profile/<profile_id>")
+def debug_profile(profile_id):
+    if not getattr(config, "PROFILING_ENABLED", False):
+        return "not found", 404
+    text = PROFILES.get(profile_id)
+    if text is None:
+        return "not found", 404
+    return app.response_class(text, mimetype="text/plain")
+
+# ---------------- Warm-up ----------------
+def warm_up(pdf=True):
+    """Load the catalog and its indexes, compile the templates and build one throwaway plan
+    (and, with pdf, load ReportLab and render that plan's PDFs) so first requests find it all hot.
+
+    Meant for gunicorn --preload: it runs once in the master and the forked workers share the
+    result. It starts no pools and writes nothing to the plan cache or store.
+    """
+    catalog=load_catalog()
+    for name in ("index.html","plan.html"):
+        app.jinja_env.get_template(name)
+    inp=parse_plan_form({})
+    target, meta=plan_target(inp)
+    res=build_plan(target, inp["meals_per_day"], inp["budget"], inp["time_per_cook"], inp["low_carb"], catalog, solver=False,
+                   reuse_stages=False)
+    if pdf:
+        rec=plan_record(inp, target, meta, res)
+        for kind in PDF_FILENAMES:
+            render_document(kind, rec)
+    metrics.reset()
+
+if getattr(config, "WARMUP", False) or os.getenv("PLANNER_WARMUP")=="1":
+    warm_up(pdf=getattr(config, "WARMUP_PDF", True))
+
 if __name__=="__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT","5000")), debug=False)
@@ -0,0 +1,268 @@
+"""Planner micro-benchmarks: each pipeline stage and both PDF exports, on the real catalog and
+synthetic catalogs scaled from it, across a sweep of plan inputs.
+
+    python bench.py --scales 1,10,100 -o bench-baseline.json       # record a baseline
+    python bench.py --scales 1,10,100 --compare bench-baseline.json  # fail (exit 1) on regressions
+    python bench.py --quick --scales 1,10                            # small sweep while iterating
+    python bench.py --verify data/plan_outputs.json                  # plans must match the recorded ones (exit 1 if not)
+
+Stage names match the planner_stage_seconds metric: choose_items, build_week, balance_1,
+budget_trim, top_up, balance_2, groceries, plus build_plan (end to end), pdf_plan, pdf_grocery,
+end_to_end (plan + both PDFs) and index_build (CatalogIndex + both views, once per scale).
+Each scenario keeps its fastest repeat; a stage's total_ms is the sum of those over the sweep
+and is what --compare checks.
+
+--verify is the output check for planner changes that must not change plans: it replays the
+random /plan forms stored in a reference file on each recorded catalog scale and compares every
+plan's days, CSV rows and cost (plan_digest) with the recorded ones. data/plan_outputs.json was
+recorded from the original greedy planner; --record-outputs writes a new reference.
+"""
+import sys, json, time, random, hashlib, platform, argparse, itertools, statistics
+import numpy as np
+import metrics
+from catalog_index import CATALOG_PATH, CatalogIndex
+
+STAGES = ("choose_items","build_week","balance_1","budget_trim","top_up","balance_2","groceries")
+
+SWEEP = {"meals_per_day": (3, 4, 5), "budget": (60, 150, 300), "low_carb": (False, True), "calories": (1600, 2200, 3000)}
+QUICK = {"meals_per_day": (3, 5), "budget": (60, 300), "low_carb": (False, True), "calories": (2200,)}
+
+# ---------------- synthetic catalogs ----------------
+def _jitter_macros(m, rng):
+    # portion size moves every macro together, composition moves each a little; kcal stays ~4/4/9 consistent
+    size = rng.lognormvariate(0, 0.2)
+    P, C, F = (max(0, int(round(m[k] * size * rng.uniform(0.9, 1.1)))) for k in ("P","C","F"))
+    atwater = 4*P + 4*C + 9*F
+    K = int(round(atwater * rng.uniform(0.95, 1.05))) if atwater else int(round(m["K"] * size))
+    return {"P": P, "C": C, "F": F, "K": max(10, K)}, size
+
+def scaled_catalog(base, factor, seed=0):
+    """base's items plus (factor-1) perturbed copies of each: same aisles, names and price/macro shape."""
+    if factor <= 1:
+        return base
+    rng = random.Random(seed)
+    rte = list(base["rte"]); recipes = list(base["recipes"])
+    for n in range(1, int(factor)):
+        for it in base["rte"]:
+            macros, size = _jitter_macros(it["macros"], rng)
+            rte.append(dict(it, name=f'{it["name"]} #{n}', macros=macros,
+                            price=round(max(0.25, float(it["price"]) * size * rng.uniform(0.85, 1.15)), 2)))
+        for r in base["recipes"]:
+            macros, size = _jitter_macros(r["macros"], rng)
+            recipes.append(dict(r, title=f'{r["title"]} #{n}', macros=macros,
+                                price_per_serv=round(max(0.5, float(r["price_per_serv"]) * size * rng.uniform(0.85, 1.15)), 2)))
+    return {"rte": rte, "recipes": recipes}
+
+# ---------------- running ----------------
+def scenarios(sweep):
+    keys = list(sweep)
+    for values in itertools.product(*(sweep[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+def _form(sc):
+    return {"goal": "Maintenance", "bodyweight": "180", "calories": str(sc["calories"]), "meals_per_day": str(sc["meals_per_day"]),
+            "budget": str(sc["budget"]), "time_per_cook": "15", "low_carb": "on" if sc["low_carb"] else ""}
+
+def run_scenario(catalog, sc, pdf=True):
+    """{stage: seconds} for one plan built from scratch (no plan cache, no solver, no restarts)."""
+    from app import parse_plan_form, plan_target, build_plan, plan_record
+    from pdf_render import render_document
+    inp = parse_plan_form(_form(sc))
+    target, meta = plan_target(inp)
+    metrics.begin_request()
+    t0 = time.perf_counter()
+    res = build_plan(target, inp["meals_per_day"], inp["budget"], inp["time_per_cook"], inp["low_carb"], catalog, solver=False,
+                     reuse_stages=False)
+    out = {"build_plan": time.perf_counter() - t0}
+    for name, dt in metrics.end_request():
+        out[name] = out.get(name, 0.0) + dt
+    if pdf:
+        rec = plan_record(inp, target, meta, res)
+        for kind in ("plan", "grocery"):
+            t = time.perf_counter()
+            render_document(kind, rec)
+            out[f"pdf_{kind}"] = time.perf_counter() - t
+        out["end_to_end"] = out["build_plan"] + out["pdf_plan"] + out["pdf_grocery"]
+    return out
+
+def _summary(per_scenario):
+    ms = sorted(v * 1000 for v in per_scenario)
+    return {"n": len(ms), "total_ms": round(sum(ms), 3), "median_ms": round(statistics.median(ms), 3),
+            "p95_ms": round(ms[min(len(ms) - 1, int(0.95 * len(ms)))], 3), "max_ms": round(ms[-1], 3)}
+
+def bench_scale(base, factor, sweep, repeat=3, pdf=True, seed=0, log=None):
+    raw = scaled_catalog(base, factor, seed)
+    builds = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        catalog = CatalogIndex(raw, f"bench-{factor}x")
+        catalog.view(False); catalog.view(True)
+        builds.append(time.perf_counter() - t)
+    run_scenario(catalog, next(scenarios(sweep)), pdf)     # warm-up
+    best = {}
+    for i, sc in enumerate(scenarios(sweep)):
+        runs = [run_scenario(catalog, sc, pdf) for _ in range(repeat)]
+        for stage in runs[0]:
+            best.setdefault(stage, []).append(min(r.get(stage, 0.0) for r in runs))
+        if log: log(f"  {factor}x scenario {i+1}: {runs[0]['build_plan']*1000:.1f} ms")
+    out = {"rte": len(raw["rte"]), "recipes": len(raw["recipes"]), "stages": {"index_build": _summary([min(builds)])}}
+    for stage, vals in best.items():
+        out["stages"][stage] = _summary(vals)
+    return out
+
+def run(scales, sweep, repeat=3, pdf=True, seed=0, catalog_path=None, log=None):
+    with open(catalog_path or CATALOG_PATH) as f:
+        base = json.load(f)
+    results = {}
+    for factor in scales:
+        if log: log(f"scale {factor}x")
+        results[f"{factor}x"] = bench_scale(base, factor, sweep, repeat, pdf, seed, log)
+    return {"meta": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                     "node": platform.node(), "when": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": repeat,
+                     "sweep": {k: list(v) for k, v in sweep.items()}, "seed": seed},
+            "results": results}
+
+# ---------------- output equivalence ----------------
+def random_forms(n, seed=0):
+    """n /plan forms spread over the ranges the form offers; about a third set calories directly."""
+    rng = random.Random(seed)
+    forms = []
+    for _ in range(n):
+        form = {"goal": rng.choice(("Fat loss", "Recomp", "Maintenance")), "meals_per_day": str(rng.choice((3, 4, 5))),
+                "bodyweight": str(rng.randint(90, 400)), "calories": str(rng.randint(1200, 4000)) if rng.random() < 0.35 else "",
+                "age": str(rng.randint(16, 85)), "activity_level": rng.choice(("sedentary", "light", "moderate", "very", "athlete")),
+                "sex": rng.choice(("neutral", "male", "female")), "time_per_cook": str(rng.choice((5, 10, 15))),
+                "budget": str(rng.randint(50, 300)), "low_carb": "on" if rng.random() < 0.5 else ""}
+        if rng.random() < 0.25:
+            form["height_cm"] = str(rng.randint(150, 200))
+        else:
+            form["height_ft"], form["height_in"] = str(rng.randint(4, 7)), str(rng.randint(0, 11))
+        forms.append(form)
+    return forms
+
+def plan_digest(res):
+    """sha1 of what a user gets from a plan: each day's meals and totals, the CSV rows and the cost."""
+    doc = {"days": [[[m["title"], m["macros"]] for m in d["meals"]] + [d["total_protein"], d["total_calories"]] for d in res["days"]],
+           "csv": [[r["name"], r["aisle"], r["qty"], r["unit"]] for r in res["csv_rows"]],
+           "cost": round(res["total_cost"], 6)}
+    return hashlib.sha1(json.dumps(doc, sort_keys=True).encode()).hexdigest()
+
+def plan_outputs(base, scales, forms, seed=0, log=None):
+    """{"<factor>x": [plan_digest per form]}, each plan built from scratch without the solver or restarts."""
+    from app import parse_plan_form, plan_target, build_plan
+    out = {}
+    for factor in scales:
+        catalog = CatalogIndex(scaled_catalog(base, factor, seed), f"verify-{factor}x")
+        digests = []
+        for form in forms:
+            inp = parse_plan_form(form)
+            target, _ = plan_target(inp)
+            res = build_plan(target, inp["meals_per_day"], inp["budget"], inp["time_per_cook"], inp["low_carb"], catalog, solver=False,
+                             reuse_stages=False)
+            digests.append(plan_digest(res))
+        out[f"{factor}x"] = digests
+        if log: log(f"scale {factor}x: {len(digests)} plans")
+    return out
+
+def verify(ref, outputs, out=sys.stdout):
+    """Print per-scale matches against a reference; return the number of plans that differ."""
+    bad = 0
+    for scale, expected in ref["outputs"].items():
+        got = outputs.get(scale, [])
+        diff = [i for i, d in enumerate(expected) if i >= len(got) or got[i] != d]
+        bad += len(diff)
+        out.write(f"{scale:<8}{len(expected) - len(diff)}/{len(expected)} plans identical\n")
+        for i in diff[:5]:
+            out.write(f"  differs: {json.dumps(ref['forms'][i], sort_keys=True)}\n")
+    return bad
+
+# ---------------- reporting ----------------
+def _order(stage):
+    order = ("index_build",) + STAGES + ("solver","build_plan","pdf_plan","pdf_grocery","end_to_end")
+    return order.index(stage) if stage in order else len(order)
+
+def report(doc, out=sys.stdout):
+    for scale, r in doc["results"].items():
+        out.write(f"\n{scale}  ({r['rte']} rte, {r['recipes']} recipes)\n")
+        out.write(f"  {'stage':<14}{'total ms':>12}{'median':>10}{'p95':>10}{'max':>10}\n")
+        for stage in sorted(r["stages"], key=_order):
+            s = r["stages"][stage]
+            out.write(f"  {stage:<14}{s['total_ms']:>12.2f}{s['median_ms']:>10.3f}{s['p95_ms']:>10.3f}{s['max_ms']:>10.3f}\n")
+
+def compare(base, new, threshold=0.15, min_ms=1.0, out=sys.stdout):
+    """Print old/new totals per (scale, stage); return the list of regressions beyond threshold."""
+    regressions = []
+    if base.get("meta", {}).get("sweep") != new["meta"]["sweep"]:
+        out.write("warning: baseline was recorded with a different input sweep\n")
+    if base.get("meta", {}).get("node") != new["meta"]["node"]:
+        out.write("warning: baseline was recorded on a different machine\n")
+    out.write(f"{'scale':<8}{'stage':<14}{'base ms':>12}{'new ms':>12}{'ratio':>8}\n")
+    for scale, r in new["results"].items():
+        old = base["results"].get(scale, {}).get("stages", {})
+        for stage in sorted(r["stages"], key=_order):
+            if stage not in old:
+                continue
+            a, b = old[stage]["total_ms"], r["stages"][stage]["total_ms"]
+            ratio = b / a if a else float("inf")
+            flag = ""
+            if ratio > 1 + threshold and b - a > min_ms:
+                flag = "  REGRESSION"
+                regressions.append((scale, stage, a, b))
+            elif ratio < 1 - threshold and a - b > min_ms:
+                flag = "  faster"
+            out.write(f"{scale:<8}{stage:<14}{a:>12.2f}{b:>12.2f}{ratio:>8.2f}{flag}\n")
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the planner pipeline on real and scaled catalogs.")
+    ap.add_argument("--scales", default=None, help="comma-separated catalog multipliers (default 1,10,100,1000; 1,20 with --record-outputs)")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per scenario; the fastest is kept")
+    ap.add_argument("--quick", action="store_true", help="small input sweep")
+    ap.add_argument("--no-pdf", action="store_true", help="skip the PDF exports")
+    ap.add_argument("--seed", type=int, default=0, help="synthetic catalog seed")
+    ap.add_argument("--catalog", default=None, help="catalog.json to scale from")
+    ap.add_argument("-o", "--output", default=None, help="write results JSON (the baseline) here")
+    ap.add_argument("--compare", default=None, help="baseline JSON to check against; exit 1 on regression")
+    ap.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown before a stage counts as regressed")
+    ap.add_argument("--min-ms", type=float, default=1.0, help="ignore slowdowns smaller than this (total ms)")
+    ap.add_argument("--verify", default=None, help="reference from --record-outputs; exit 1 if any plan differs")
+    ap.add_argument("--record-outputs", default=None, help="write plan digests for random /plan forms here")
+    ap.add_argument("--cases", type=int, default=100, help="random forms for --record-outputs")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    log = (lambda msg: print(msg, file=sys.stderr)) if args.verbose else None
+    if args.verify or args.record_outputs:
+        with open(args.catalog or CATALOG_PATH) as f:
+            base = json.load(f)
+        if args.verify:
+            with open(args.verify) as f:
+                ref = json.load(f)
+            scales = [int(s[:-1]) for s in ref["outputs"]]
+            outputs = plan_outputs(base, scales, ref["forms"], ref["meta"]["seed"], log)
+            if verify(ref, outputs):
+                sys.exit(1)
+            return
+        scales = [int(s) for s in (args.scales or "1,20").split(",") if s.strip()]
+        forms = random_forms(args.cases, args.seed)
+        doc = {"meta": {"when": time.strftime("%Y-%m-%dT%H:%M:%S"), "seed": args.seed, "cases": args.cases},
+               "forms": forms, "outputs": plan_outputs(base, scales, forms, args.seed, log)}
+        with open(args.record_outputs, "w") as f:
+            json.dump(doc, f, indent=1)
+        return
+
+    scales = [int(s) for s in (args.scales or "1,10,100,1000").split(",") if s.strip()]
+    doc = run(scales, QUICK if args.quick else SWEEP, args.repeat, not args.no_pdf, args.seed, args.catalog, log)
+    report(doc)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(doc, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        print()
+        if compare(base, doc, args.threshold, args.min_ms):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Bulk plan generation: JSONL profiles in, NDJSON plans out, fanned out over a process pool.
+
+Each input line is a JSON object with the same fields the /plan form posts (goal, bodyweight,
+calories, meals_per_day, budget, time_per_cook, low_carb, age, activity_level, height_ft,
+height_in, height_cm, sex) plus an optional "id" that is echoed back.
+
+    python bulk.py profiles.jsonl -o plans.ndjson --workers 8 --chunk-size 16 --unordered
+    python bulk.py profiles.jsonl -o /dev/null --order-csv order.csv --order-pdf order.pdf
+
+With --order-csv/--order-pdf every plan is also folded into one group grocery order
+(grocery_order.py) as it streams past; a profile's optional "household" multiplies its share.
+"""
+import os, sys, json, argparse, itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from catalog_index import load_catalog
+
+_CATALOG_PATH = None
+_ORDER_LINES = False
+
+def _init_worker(catalog_path=None, order_lines=False):
+    # warm the per-process catalog index once instead of on the first plan
+    global _CATALOG_PATH, _ORDER_LINES
+    _CATALOG_PATH = catalog_path
+    _ORDER_LINES = order_lines
+    load_catalog(catalog_path)
+
+def form_from_profile(profile):
+    # JSON profiles carry numbers/bools; the planner reads form strings
+    form = {}
+    for k, v in profile.items():
+        if v is None: continue
+        if k == "low_carb":
+            form[k] = "on" if v in (True, "on", "true", "1", 1) else ""
+        else:
+            form[k] = str(v)
+    return form
+
+def plan_profile(index, profile):
+    from app import parse_plan_form, plan_target, cached_plan
+    pid = profile.get("id") if isinstance(profile, dict) else None
+    try:
+        inp = parse_plan_form(form_from_profile(profile))
+        target, meta = plan_target(inp)
+        res = cached_plan(target, inp["meals_per_day"], inp["budget"], inp["time_per_cook"], inp["low_carb"], load_catalog(_CATALOG_PATH))
+    except Exception as e:
+        return {"index": index, "id": pid, "error": f"{type(e).__name__}: {e}"}
+    out = {
+        "index": index, "id": pid,
+        "targets": {k: target[k] for k in ("calories","protein_g","protein_cap","fat_g","carb_g")},
+        "bmr": meta["bmr"], "tdee": meta["tdee"],
+        "days": res["days"], "grocery": res["csv_rows"], "total_cost": round(res["total_cost"], 2),
+    }
+    if _ORDER_LINES:
+        # compact grocery lines for fold_order; the parent drops them before writing the plan out
+        from grocery_order import plan_lines
+        out["order_lines"] = plan_lines(res["chosen"], res["extras"])
+        out["household"] = profile.get("household", 1)
+    return out
+
+def plan_chunk(chunk):
+    return [plan_profile(i, p) for i, p in chunk]
+
+def read_profiles(lines):
+    """(index, profile) pairs from JSONL; blank lines are skipped, bad lines become error results."""
+    for i, line in enumerate(lines):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line: continue
+        try:
+            profile = json.loads(line)
+        except ValueError as e:
+            profile = {"_error": f"invalid JSON: {e}"}
+        if not isinstance(profile, dict):
+            profile = {"_error": "profile must be a JSON object"}
+        yield i, profile
+
+def _chunks(pairs, size):
+    it = iter(pairs)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk: return
+        yield chunk
+
+def iter_bulk_plans(pairs, workers=None, chunk_size=8, ordered=True, catalog_path=None, order_lines=False):
+    """Yield plan dicts as they finish. At most 2 chunks per worker are in flight, so memory stays bounded.
+    order_lines adds each plan's grocery_order.plan_lines (and household) for fold_order."""
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    chunk_size = max(1, int(chunk_size))
+    chunks = _chunks(pairs, chunk_size)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(catalog_path, order_lines)) as ex:
+        inflight = deque()
+        def fill():
+            while len(inflight) < workers*2:
+                chunk = next(chunks, None)
+                if chunk is None: return
+                bad = [{"index": i, "id": None, "error": p["_error"]} for i, p in chunk if "_error" in p]
+                good = [(i, p) for i, p in chunk if "_error" not in p]
+                inflight.append((ex.submit(plan_chunk, good), bad))
+        fill()
+        while inflight:
+            if ordered:
+                fut, bad = inflight.popleft()
+                done = [(fut, bad)]
+            else:
+                finished, _ = wait([f for f, _ in inflight], return_when=FIRST_COMPLETED)
+                done = [x for x in inflight if x[0] in finished]
+                for x in done: inflight.remove(x)
+            for fut, bad in done:
+                rows = bad + fut.result()
+                if ordered: rows.sort(key=lambda r: r["index"])
+                yield from rows
+            fill()
+
+def fold_order(rows, order):
+    """Pass rows through, folding each plan's order lines into order (a GroceryOrder) on the way."""
+    for r in rows:
+        lines = r.pop("order_lines", None)
+        household = r.pop("household", 1)
+        if lines is not None:
+            try: household = int(household or 1)
+            except (TypeError, ValueError): household = 1
+            order.add_lines(lines, household)
+        yield r
+
+def to_ndjson(rows):
+    for r in rows:
+        yield json.dumps(r, separators=(",",":")) + "\n"
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate meal plans in bulk from a JSONL file of profiles.")
+    ap.add_argument("input", help="JSONL profiles ('-' for stdin)")
+    ap.add_argument("-o", "--output", default="-", help="NDJSON output ('-' for stdout)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--chunk-size", type=int, default=8, help="profiles per pool task")
+    ap.add_argument("--unordered", action="store_true", help="emit plans as they finish instead of in input order")
+    ap.add_argument("--catalog", default=None, help="catalog.json path")
+    ap.add_argument("--order-csv", default=None, help="also write the merged group grocery order as CSV")
+    ap.add_argument("--order-pdf", default=None, help="also write the merged group grocery order as PDF")
+    args = ap.parse_args(argv)
+
+    src = sys.stdin if args.input == "-" else open(args.input, "r")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        want_order = bool(args.order_csv or args.order_pdf)
+        rows = iter_bulk_plans(read_profiles(src), args.workers, args.chunk_size, not args.unordered, args.catalog, want_order)
+        if want_order:
+            from grocery_order import GroceryOrder
+            order = GroceryOrder()
+            rows = fold_order(rows, order)
+        for line in to_ndjson(rows):
+            dst.write(line); dst.flush()
+        if args.order_csv:
+            with open(args.order_csv, "w", newline="") as f:
+                order.write_csv(f)
+        if args.order_pdf:
+            with open(args.order_pdf, "wb") as f:
+                f.write(order.to_pdf())
+    finally:
+        if src is not sys.stdin: src.close()
+        if dst is not sys.stdout: dst.close()
+
+if __name__ == "__main__":
+    main()
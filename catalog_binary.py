@@ -0,0 +1,326 @@
+"""Compiled catalog: catalog.json packed into one read-only file that every worker memory-maps.
+
+    python catalog_binary.py data/catalog.json data/catalog.bin
+
+Layout: 8-byte magic, uint32 header length, JSON header, then 8-byte aligned sections, all
+little-endian: one float64 column per numeric field (and per key of numeric groups such as
+macros), uint32 string-id columns, uint32 (start, length) pairs into a string-id pool for lists
+of strings, and one interned string table (uint32 offsets + utf-8 bytes). A field that does not
+fit a column (missing on some items, mixed types, nested data) stays per item as JSON in the
+string table. The header records the source catalog's version, so a stale file is never used.
+
+Items come back as read-only Mapping accessors over the mapped pages, so planner code, exports
+and templates index them exactly like the JSON dicts; numeric columns are also exposed as
+zero-copy numpy arrays for the vectorized paths. An item (and its macros) iterates its keys in
+the collection's field order, which can differ from the JSON for items written in another order.
+"""
+import os, sys, json, mmap, struct, hashlib
+from collections.abc import Mapping
+import numpy as np
+
+MAGIC = b"MPCAT01\n"
+NONE = 0xFFFFFFFF
+MAX_EXACT = 2**53
+
+def _align(n):
+    return (n + 7) & ~7
+
+def _is_num(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool) and not (isinstance(v, int) and abs(v) > MAX_EXACT)
+
+def _kind(values):
+    if all(_is_num(v) for v in values):
+        return "num"
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    if all(isinstance(v, list) and all(isinstance(s, str) for s in v) for v in values):
+        return "strs"
+    if all(isinstance(v, dict) for v in values):
+        keys = set(values[0])
+        if all(v.keys() == keys for v in values) and all(_is_num(x) for v in values for x in v.values()):
+            return "group"
+    return None
+
+# ---------------- build ----------------
+class _Writer:
+    def __init__(self):
+        self.sections = []; self.size = 0
+        self.strings = {}; self.pool = []
+
+    def add(self, data):
+        off = self.size
+        self.sections.append((off, data))
+        self.size = _align(off + len(data))
+        return off
+
+    def intern(self, s):
+        i = self.strings.get(s)
+        if i is None:
+            i = self.strings[s] = len(self.strings)
+        return i
+
+    def numeric(self, values):
+        off = self.add(np.asarray(values, dtype="<f8").tobytes())
+        if all(isinstance(v, int) for v in values):
+            return {"offset": off, "ints": "all"}
+        if not any(isinstance(v, int) for v in values):
+            return {"offset": off, "ints": "none"}
+        return {"offset": off, "ints": self.add(bytes(isinstance(v, int) for v in values))}
+
+def _collection(w, items):
+    names = []
+    for it in items:
+        for k in it:
+            if k not in names: names.append(k)
+    fields, columnar = [], set()
+    for name in names:
+        if not all(name in it for it in items):
+            continue
+        values = [it[name] for it in items]
+        kind = _kind(values)
+        if kind == "num":
+            fields.append(dict(w.numeric(values), name=name, kind="num"))
+        elif kind == "str":
+            ids = [w.intern(v) for v in values]
+            fields.append({"name": name, "kind": "str", "offset": w.add(np.asarray(ids, dtype="<u4").tobytes())})
+        elif kind == "strs":
+            pairs = []
+            for v in values:
+                pairs += [len(w.pool), len(v)]
+                w.pool += [w.intern(s) for s in v]
+            fields.append({"name": name, "kind": "strs", "offset": w.add(np.asarray(pairs, dtype="<u4").tobytes())})
+        elif kind == "group":
+            keys = list(values[0])
+            fields.append({"name": name, "kind": "group", "keys": keys,
+                           "columns": [w.numeric([v[k] for v in values]) for k in keys]})
+        else:
+            continue
+        columnar.add(name)
+    rest = []
+    for it in items:
+        extra = {k: v for k, v in it.items() if k not in columnar}
+        rest.append(w.intern(json.dumps(extra, separators=(",",":"))) if extra else NONE)
+    spec = {"count": len(items), "fields": fields, "rest": None}
+    if any(r != NONE for r in rest):
+        spec["rest"] = w.add(np.asarray(rest, dtype="<u4").tobytes())
+    return spec
+
+def build(src, dst):
+    """Compile the catalog JSON at src into dst (atomically replaced); returns the header."""
+    with open(src, "rb") as f:
+        blob = f.read()
+    raw = json.loads(blob)
+    w = _Writer()
+    collections, extra = {}, {}
+    for key, value in raw.items():
+        if isinstance(value, list) and all(isinstance(v, dict) for v in value):
+            collections[key] = _collection(w, value)
+        else:
+            extra[key] = value
+    pool_off = w.add(np.asarray(w.pool, dtype="<u4").tobytes())
+    encoded = [s.encode("utf-8") for s in w.strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+    header = {
+        "format": 1, "version": hashlib.sha1(blob).hexdigest()[:16], "order": list(raw), "extra": extra,
+        "collections": collections, "pool": {"offset": pool_off, "count": len(w.pool)},
+        "strings": {"count": len(encoded), "offsets": w.add(offsets.tobytes()), "data": w.add(b"".join(encoded))},
+    }
+    head = json.dumps(header, separators=(",",":")).encode("utf-8")
+    base = _align(len(MAGIC) + 4 + len(head))
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(head)) + head)
+        for off, data in w.sections:
+            f.seek(base + off); f.write(data)
+        f.truncate(base + w.size)
+    # replace, never rewrite in place: running workers keep their mapping of the old inode
+    os.replace(tmp, dst)
+    return header
+
+# ---------------- read ----------------
+class Group(Mapping):
+    """A numeric sub-record such as item["macros"]."""
+    __slots__ = ("_g", "_i")
+
+    def __init__(self, g, i):
+        self._g = g; self._i = i
+
+    def __getitem__(self, key):
+        return self._g[key](self._i)
+
+    def __iter__(self):
+        return iter(self._g)
+
+    def __len__(self):
+        return len(self._g)
+
+    def copy(self):
+        return {k: f(self._i) for k, f in self._g.items()}
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+    def __repr__(self):
+        return repr(self.copy())
+
+class Item(Mapping):
+    """One catalog record, read from the mapped file on access."""
+    __slots__ = ("_c", "_i")
+
+    def __init__(self, c, i):
+        self._c = c; self._i = i
+
+    def __getitem__(self, key):
+        f = self._c.getters.get(key)
+        if f is not None:
+            return f(self._i)
+        return self._c.rest(self._i)[key]
+
+    def __iter__(self):
+        yield from self._c.getters
+        yield from self._c.rest(self._i)
+
+    def __len__(self):
+        return len(self._c.getters) + len(self._c.rest(self._i))
+
+    def __eq__(self, other):
+        if isinstance(other, Item) and other._c is self._c:
+            return other._i == self._i
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def copy(self):
+        return {k: (v.copy() if isinstance(v, Group) else v) for k, v in self.items()}
+
+    def __reduce__(self):
+        # pickles (process pools, caches) carry plain dicts, not the mapping
+        return (dict, (self.copy(),))
+
+    def __repr__(self):
+        return repr(self.copy())
+
+class _Collection:
+    def __init__(self, cat, spec):
+        self.cat = cat
+        self.count = n = spec["count"]
+        self.getters = {}
+        self.columns = {}
+        for f in spec["fields"]:
+            if f["kind"] == "num":
+                self.getters[f["name"]] = cat.number_getter(f, n)
+                self.columns[f["name"]] = cat.array(f["offset"], "<f8", n)
+            elif f["kind"] == "str":
+                ids = cat.view(f["offset"], "I", n); s = cat.string
+                self.getters[f["name"]] = lambda i, ids=ids, s=s: s(ids[i])
+            elif f["kind"] == "strs":
+                pairs = cat.view(f["offset"], "I", 2*n); pool = cat.pool; s = cat.string
+                self.getters[f["name"]] = lambda i, p=pairs, pool=pool, s=s: [s(j) for j in pool[p[2*i]:p[2*i]+p[2*i+1]]]
+            else:
+                g = {k: cat.number_getter(col, n) for k, col in zip(f["keys"], f["columns"])}
+                for k, col in zip(f["keys"], f["columns"]):
+                    self.columns[(f["name"], k)] = cat.array(col["offset"], "<f8", n)
+                self.getters[f["name"]] = lambda i, g=g: Group(g, i)
+        self._rest = cat.view(spec["rest"], "I", n) if spec["rest"] is not None else None
+        self._rest_cache = {}
+        self.items = [Item(self, i) for i in range(n)]
+
+    def rest(self, i):
+        if self._rest is None or self._rest[i] == NONE:
+            return {}
+        r = self._rest_cache.get(i)
+        if r is None:
+            r = self._rest_cache[i] = json.loads(self.cat.string(self._rest[i]))
+        return r
+
+class BinaryCatalog(Mapping):
+    """A compiled catalog mapped read-only; catalog["rte"] etc. are lists of Item accessors."""
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("compiled catalogs are little-endian")
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mv = memoryview(self._mm)
+        if bytes(self._mv[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path}: not a compiled catalog")
+        (hlen,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        header = json.loads(bytes(self._mv[len(MAGIC)+4:len(MAGIC)+4+hlen]))
+        if header.get("format") != 1:
+            raise ValueError(f"{path}: unsupported catalog format {header.get('format')}")
+        self.header = header
+        self.version = header["version"]
+        self._base = _align(len(MAGIC) + 4 + hlen)
+        st = header["strings"]
+        self._str_off = self.view(st["offsets"], "I", st["count"] + 1)
+        self._str_data = self._base + st["data"]
+        self._str_cache = [None] * st["count"]
+        self.pool = self.view(header["pool"]["offset"], "I", header["pool"]["count"])
+        self._collections = {name: _Collection(self, spec) for name, spec in header["collections"].items()}
+        self._data = {}
+        for key in header["order"]:
+            self._data[key] = self._collections[key].items if key in self._collections else header["extra"][key]
+
+    # raw access
+    def view(self, off, fmt, count):
+        start = self._base + off
+        return self._mv[start:start + count*struct.calcsize(fmt)].cast(fmt)
+
+    def array(self, off, dtype, count):
+        return np.frombuffer(self._mm, dtype=dtype, count=count, offset=self._base + off)
+
+    def string(self, i):
+        s = self._str_cache[i]
+        if s is None:
+            o = self._str_off
+            s = self._str_cache[i] = str(self._mv[self._str_data + o[i]:self._str_data + o[i+1]], "utf-8")
+        return s
+
+    def number_getter(self, spec, n):
+        col = self.view(spec["offset"], "d", n)
+        if spec["ints"] == "all":
+            return lambda i: int(col[i])
+        if spec["ints"] == "none":
+            return col.__getitem__
+        mask = self.view(spec["ints"], "B", n)
+        return lambda i: int(col[i]) if mask[i] else col[i]
+
+    def column(self, collection, field, key=None):
+        """Zero-copy float64 numpy column, e.g. column("rte", "macros", "K") or column("rte", "price")."""
+        return self._collections[collection].columns[field if key is None else (field, key)]
+
+    # Mapping
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+def compiled_path(json_path):
+    return os.path.splitext(json_path)[0] + ".bin"
+
+def open_compiled(path, version=None):
+    """The BinaryCatalog at path, or None if it is missing, unreadable or built from another version."""
+    try:
+        cat = BinaryCatalog(path)
+    except (OSError, ValueError):
+        return None
+    if version is not None and cat.version != version:
+        return None
+    return cat
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    src = argv[0] if argv else os.path.join("data", "catalog.json")
+    dst = argv[1] if len(argv) > 1 else compiled_path(src)
+    header = build(src, dst)
+    counts = ", ".join(f"{k} {v['count']}" for k, v in header["collections"].items())
+    print(f"{dst}: version {header['version']}, {counts}, {header['strings']['count']} strings, {os.path.getsize(dst)} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import os, re, json, hashlib, threading, heapq, bisect, unicodedata
+import numpy as np
+import config
+from catalog_binary import BinaryCatalog, compiled_path, open_compiled
+import links
+
+CATALOG_PATH = os.path.join("data", "catalog.json")
+
+def low_carb_ok(obj, max_c=20, is_recipe=False):
+    C = obj["macros"]["C"]
+    if is_recipe:
+        return C <= max_c*2
+    return C <= max_c
+
+def score_item(item, per_meal_k):
+    P = max(1, item["macros"]["P"])
+    ppd = float(item["price"]) / max(1e-6,(P/25.0))
+    return abs(item["macros"]["K"] - per_meal_k) * 0.55 + ppd * 0.45
+
+def recipe_lines(recipe):
+    """(grocery line name, ingredient) for the ingredients a recipe puts on the grocery list."""
+    return [(f"{ing} ({recipe['title']})", ing) for ing in recipe["ingredients"][:4]]
+
+_ING_JUNK = re.compile(r"[^a-z0-9%/ ]+")
+
+def _singular(word):
+    if len(word) > 4 and word.endswith("ies"): return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "sses", "xes")): return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")): return word[:-1]
+    return word
+
+def ingredient_key(ing):
+    """Canonical name an ingredient merges under across recipes: lowercased, punctuation folded,
+    last word singular ("Egg Whites" and "egg white" meet), then config.INGREDIENT_ALIASES."""
+    words = _ING_JUNK.sub(" ", unicodedata.normalize("NFKC", ing).lower()).split()
+    if words:
+        words[-1] = _singular(words[-1])
+    key = " ".join(words)
+    return (getattr(config, "INGREDIENT_ALIASES", None) or {}).get(key, key)
+
+# ---------------- selection ----------------
+KCAL_BUCKET = 50
+
+def kcal_buckets(items, width=KCAL_BUCKET, K=None, base=None):
+    """[(lo, hi, floor, [(pos, item), ...])]: items grouped by kcal band, floor = lowest price term in the band.
+
+    K and base (score_item at zero kcal distance) may be passed as arrays aligned with items.
+    """
+    if K is None:
+        K = [it["macros"]["K"] for it in items]
+        # score at zero kcal distance is just the price-per-protein term
+        base = [score_item(it, it["macros"]["K"]) for it in items]
+    else:
+        K = np.asarray(K).astype(np.int64).tolist(); base = np.asarray(base).tolist()
+    groups = {}
+    for pos, it in enumerate(items):
+        groups.setdefault(int(K[pos]) // width, []).append(pos)
+    out = []
+    for b in sorted(groups):
+        members = groups[b]
+        out.append((b*width, (b+1)*width, min(base[p] for p in members), [(p, items[p]) for p in members]))
+    return out
+
+def top_rte(items, buckets, per_meal_k, n):
+    """Same as sorted(items, key=score_item)[:n], visiting kcal bands nearest per_meal_k first."""
+    if n >= len(items):
+        return sorted(items, key=lambda x: score_item(x, per_meal_k))
+    def bound(b):
+        lo, hi, floor, _ = b
+        dist = 0 if lo <= per_meal_k < hi else min(abs(per_meal_k - lo), abs(per_meal_k - (hi - 1)))
+        return dist * 0.55 + floor
+    heap = []   # max-heap on (score, pos) via negation
+    for lb, b in sorted(((bound(b), b) for b in buckets), key=lambda t: t[0]):
+        if len(heap) == n and lb > -heap[0][0] + 1e-9:
+            break
+        for pos, it in b[3]:
+            key = (score_item(it, per_meal_k), pos)
+            if len(heap) < n:
+                heapq.heappush(heap, (-key[0], -key[1], it))
+            elif key < (-heap[0][0], -heap[0][1]):
+                heapq.heapreplace(heap, (-key[0], -key[1], it))
+    return [it for _, _, it in sorted(heap, key=lambda t: (-t[0], -t[1]))]
+
+def nearest_recipes(items, by_k, ks, per_meal_k, n):
+    """Same as sorted(items, key=|K - per_meal_k|)[:n] using a kcal-sorted index and bisect."""
+    if n >= len(items):
+        return sorted(items, key=lambda r: abs(r["macros"]["K"] - per_meal_k))
+    # walk outward from the insertion point to find the n-th smallest distance ...
+    lo = hi = bisect.bisect_left(ks, per_meal_k)
+    d = 0
+    for _ in range(n):
+        if hi < len(ks) and (lo == 0 or ks[hi] - per_meal_k <= per_meal_k - ks[lo-1]):
+            d = ks[hi] - per_meal_k; hi += 1
+        else:
+            lo -= 1; d = per_meal_k - ks[lo]
+    # ... then take everything within it, so ties keep catalog order
+    window = by_k[bisect.bisect_left(ks, per_meal_k - d):bisect.bisect_right(ks, per_meal_k + d)]
+    window.sort(key=lambda t: (abs(t[1]["macros"]["K"] - per_meal_k), t[0]))
+    return [r for _, r in window[:n]]
+
+# ---------------- indexes ----------------
+class CatalogIndex:
+    """Catalog plus everything the planner derives from it, built once per catalog version."""
+
+    def __init__(self, raw, version=""):
+        self.raw = raw
+        self.version = version
+        self.rte = raw["rte"]
+        self.recipes = raw["recipes"]
+        self.row = {id(r): i for i, r in enumerate(self.rte)}
+        self.soa = self._build_soa(raw)
+        self.views = {False: self._build_view(False), True: self._build_view(True)}
+        # every grocery line this catalog can produce gets its /go/ token up front
+        for r in self.rte:
+            links.register(r["name"])
+        for r in self.recipes:
+            for name, ing in recipe_lines(r):
+                links.register(name); links.register(ingredient_key(ing))
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def view(self, low_carb=False):
+        return self.views[bool(low_carb)]
+
+    @staticmethod
+    def _build_soa(raw):
+        # struct-of-arrays view of the RTE list: one float64 column per macro plus filler-class masks
+        rte = raw["rte"]
+        if isinstance(raw, BinaryCatalog):
+            # compiled catalogs already store these columns; the arrays are views of the shared mapping
+            soa = {k: raw.column("rte", "macros", k) for k in ("P","C","F","K")}
+            soa["price"] = raw.column("rte", "price")
+        else:
+            soa = {k: np.array([float(r["macros"][k]) for r in rte], dtype=np.float64) for k in ("P","C","F","K")}
+            soa["price"] = np.array([float(r["price"]) for r in rte], dtype=np.float64)
+        P, C, F, K = soa["P"], soa["C"], soa["F"], soa["K"]
+        soa["booster"] = (P>=25) & (K<=230)
+        soa["carb"] = C>=25
+        soa["fat"] = F>=10
+        soa["balanced"] = (12<=P) & (P<=24) & (15<=C) & (C<=35)
+        soa["micro"] = K<=120
+        soa["low_carb"] = C<=20
+        # score_item at zero kcal distance, same float ops
+        soa["base_score"] = soa["price"] / np.maximum(1e-6, np.maximum(1.0, P)/25.0) * 0.45
+        return soa
+
+    def gather(self, items):
+        """Columns for an ordered (possibly repeating) list of RTE items, ready for vectorized scoring."""
+        rows = np.array([self.row[id(i)] for i in items], dtype=np.intp)
+        soa = self.soa
+        return {"rows": rows, "P": soa["P"][rows], "C": soa["C"][rows], "F": soa["F"][rows],
+                "K": soa["K"][rows], "booster": soa["booster"][rows]}
+
+    @staticmethod
+    def filler_frontier(fillers, price=None, K=None):
+        """Drop every filler that an earlier one beats on both price (<=) and kcal (>=).
+
+        Such a filler can never be the top-up pick: the earlier one fits any budget it fits,
+        gains at least as much per dollar and wins ties by coming first. Prefix max over
+        price ranks (Fenwick tree) keeps this O(n log n). price/K: optional columns aligned with fillers.
+        """
+        if price is None:
+            price = [float(f["price"]) for f in fillers]
+            K = [f["macros"]["K"] for f in fillers]
+        else:
+            price = price.tolist(); K = K.tolist()
+        prices = sorted(set(price))
+        rank = {p: i+1 for i, p in enumerate(prices)}
+        tree = [float("-inf")] * (len(prices)+1)
+        keep = []
+        for pos, f in enumerate(fillers):
+            r = rank[price[pos]]; k = K[pos]
+            i, best = r, float("-inf")
+            while i > 0:
+                best = max(best, tree[i]); i -= i & -i
+            if best < k:
+                keep.append(f)
+            i = r
+            while i <= len(prices):
+                if tree[i] < k: tree[i] = k
+                i += i & -i
+        return {"items": keep,
+                "price": np.array([float(f["price"]) for f in keep], dtype=np.float64),
+                "K": np.array([float(f["macros"]["K"]) for f in keep], dtype=np.float64)}
+
+    def _build_view(self, low_carb):
+        # RTE filters run on the SoA masks (same items, same order as the list comprehensions
+        # they replace), so compiled catalogs never touch per-item accessors here
+        rte, soa = self.rte, self.soa
+        C, K = soa["C"], soa["K"]
+        pick = lambda mask: [rte[i] for i in np.flatnonzero(mask)]
+        lc_mask = soa["low_carb"] if low_carb else np.ones(len(rte), dtype=bool)
+        v = {}
+        rows = np.flatnonzero(lc_mask)
+        v["rte"] = [rte[i] for i in rows]
+        v["recipes"] = [r for r in self.recipes if low_carb_ok(r, 40, True)] if low_carb else list(self.recipes)
+
+        # choose_items
+        v["rte_buckets"] = kcal_buckets(v["rte"], K=K[rows], base=soa["base_score"][rows])
+        v["recipes_by_k"] = sorted(enumerate(v["recipes"]), key=lambda t: (t[1]["macros"]["K"], t[0]))
+        v["recipe_ks"] = [r["macros"]["K"] for _, r in v["recipes_by_k"]]
+
+        # build_week_plan
+        side = np.flatnonzero((60<=K) & (K<=350) & lc_mask)
+        side = side[np.argsort(K[side], kind="stable")]
+        v["side_pool"] = [rte[i] for i in side]
+        v["side_ks"] = K[side].tolist()
+
+        # balance_macros_for_week
+        classes = [soa["booster"], soa["carb"], soa["fat"], soa["balanced"], soa["micro"]]
+        boosters, carb_fillers, fat_fillers, balanced_fillers, micro = (pick(m) for m in classes)
+        candidates = boosters + carb_fillers + fat_fillers + balanced_fillers + micro
+        if low_carb:
+            # the balancer skips non low-carb candidates in low-carb mode, so drop them up front
+            candidates = [x for m in classes for x in pick(m & lc_mask)]
+            v["gap_pools"] = {
+                "P": pick(soa["booster"] & lc_mask),
+                "C": pick(soa["balanced"] & (C<=18)) + pick(soa["micro"] & (C<=10)),
+                "F": pick(soa["fat"] & lc_mask),
+            }
+        else:
+            v["gap_pools"] = {"P": boosters, "C": carb_fillers, "F": fat_fillers}
+        v["boosters"] = boosters
+        v["carb_fillers"] = carb_fillers
+        v["fat_fillers"] = fat_fillers
+        v["balanced_fillers"] = balanced_fillers
+        v["micro"] = micro
+        v["candidates"] = candidates
+        # pool + candidates in scan order, per macro gap
+        v["scan"] = {g: self.gather(v["gap_pools"][g] + candidates) for g in ("P","C","F")}
+
+        # solver: every item the balancer could add (it never adds anything over 350 kcal)
+        pool = pick(lc_mask & (K <= 350))
+        v["solver_pool"] = dict(self.gather(pool), items=pool)
+        v["solver_pool"]["price"] = self.soa["price"][v["solver_pool"]["rows"]]
+
+        # top_up_days_with_budget
+        fillers = np.flatnonzero((K>=60) & lc_mask)
+        fillers = fillers[np.argsort(soa["price"][fillers] / np.maximum(1, K[fillers]), kind="stable")]
+        v["cheap_fillers"] = [rte[i] for i in fillers]
+        v["filler_frontier"] = self.filler_frontier(v["cheap_fillers"], soa["price"][fillers], K[fillers])
+        return v
+
+# ---------------- process-wide cache ----------------
+_LOCK = threading.Lock()
+_CACHE = {"path": None, "stat": None, "index": None}
+
+def _stat_key(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _read_catalog(path, blob, version):
+    # a compiled catalog (catalog_binary.py) next to the JSON is used when it was built from this exact version
+    if getattr(config, "CATALOG_COMPILED", True):
+        compiled = open_compiled(compiled_path(path), version)
+        if compiled is not None:
+            return compiled
+    return json.loads(blob)
+
+def load_catalog(path=None):
+    """Return the shared CatalogIndex, re-reading the file only when its mtime/size and hash change.
+
+    path may also name a compiled .bin catalog directly.
+    """
+    path = path or CATALOG_PATH
+    key = _stat_key(path)
+    if _CACHE["path"] == path and _CACHE["stat"] == key:
+        return _CACHE["index"]
+    with _LOCK:
+        key = _stat_key(path)
+        if _CACHE["path"] == path and _CACHE["stat"] == key:
+            return _CACHE["index"]
+        if path.endswith(".bin"):
+            raw = BinaryCatalog(path)
+            version = raw.version
+        else:
+            with open(path, "rb") as f:
+                blob = f.read()
+            version = hashlib.sha1(blob).hexdigest()[:16]
+            raw = None
+        idx = _CACHE["index"]
+        if idx is None or _CACHE["path"] != path or idx.version != version:
+            idx = CatalogIndex(raw if raw is not None else _read_catalog(path, blob, version), version)
+        _CACHE.update(path=path, stat=key, index=idx)
+        return idx
@@ -4,4 +4,82 @@ BRAND_NAME = "ActivBlaze Corporate Cut"
 TERMS_URL = "https://example.com/terms"  # not shown in UI
 FAVICON = "/static/favicon.png"
 UTM_CAMPAIGN = "corporate-cut"
+PUBLIC_BASE_URL = None  # origin used for /go/ links inside PDFs; None = the requesting host
 ACCENT = "#f97316"  # Tailwind orange-500
+
+# Plan cache (memoized /plan results keyed on normalized inputs + catalog version)
+PLAN_CACHE_SIZE = 512       # entries; 0 disables
+PLAN_CACHE_TTL = 3600       # seconds; 0 = no expiry
+PLAN_CACHE_POLICY = "lru"   # "lru" or "fifo"
+PLAN_CACHE_QUANTIZE = {"bodyweight": 0, "calories": 0}  # e.g. {"bodyweight": 1} rounds to the nearest lb
+
+# Plan store (lets /export/<plan_id>/... work on any worker)
+PLAN_STORE = "memory"       # "memory" (single process) or "sqlite" (shared by all workers on the host)
+PLAN_STORE_PATH = None      # sqlite file; defaults to <tmpdir>/activblaze-plans.sqlite3
+PLAN_STORE_SIZE = 1000      # memory store entries
+PLAN_STORE_TTL = 86400      # seconds
+
+# Rendered PDF cache (per worker), bounded by total bytes
+PDF_CACHE_BYTES = 64 * 1024 * 1024
+
+# Background PDF rendering (process pool)
+PDF_ASYNC = False           # True: export routes enqueue a render job and return 202 + job id (or pass ?async=1)
+PDF_PRERENDER = False       # start both PDF jobs as soon as /plan completes
+PDF_POOL_WORKERS = 2
+PDF_QUEUE_MAX = 32          # pending jobs per worker before exports answer 503
+
+# Bulk planning (/bulk/plan and bulk.py)
+BULK_WORKERS = None         # None = os.cpu_count(); also the most ?workers= may ask for
+BULK_CHUNK_SIZE = 8         # profiles per pool task
+BULK_MAX_CHUNK_SIZE = 64    # largest ?chunk= accepted
+BULK_MAX_PROFILES = 5000    # per request
+
+# JSON API
+API_CACHE_MAX_AGE = 300     # seconds edge/browser caches may reuse an /api/plan response
+# accepted (min, max) per input; anything outside is a 400 from /plan and /api/plan
+PLAN_INPUT_BOUNDS = {"meals_per_day": (1, 8), "budget": (1, 5000), "bodyweight": (50, 1000),
+                     "calories": (800, 10000), "age": (10, 120), "time_per_cook": (0, 240), "height_cm": (90, 260)}
+
+# Deadline-bounded optimizer (local search over each day's extras, seeded with the greedy plan)
+PLAN_SOLVER = False             # default for /plan; /api/plan also takes ?solver=1 / ?solver=0
+PLAN_SOLVER_DEADLINE_MS = 50    # wall-clock budget per plan
+PLAN_SOLVER_MAX_COPIES = 3      # max copies of one item per day the solver may add
+
+# Randomized restarts (perturbed selection + balancing raced on a process pool; lowest penalty wins)
+PLAN_RESTARTS = 0               # variants per plan; 0 = off. /api/plan also takes ?restarts=N
+PLAN_RESTARTS_MAX = 16          # upper bound for PLAN_RESTARTS and ?restarts=N
+PLAN_RESTARTS_WORKERS = None    # None = os.cpu_count()
+PLAN_RESTARTS_TIME_MS = 150     # variants not finished by then are dropped
+PLAN_RESTARTS_JITTER = 0.08     # +/- fraction applied to the per-meal kcal target and selection scores
+
+# Instrumentation (Server-Timing header, /metrics, sampling profiler)
+SERVER_TIMING = True            # add a Server-Timing header with per-stage durations to every response
+PROFILING_ENABLED = False       # allow ?profile=1 to sample the request; folded stacks at /debug/profile/<id>
+PROFILE_INTERVAL_MS = 2
+PROFILE_KEEP = 20               # profiles kept per worker
+
+# Compiled catalog (python catalog_binary.py builds data/catalog.bin from data/catalog.json)
+CATALOG_COMPILED = True     # memory-map data/catalog.bin when it was built from the current catalog.json
+
+# Cold start
+# WARMUP runs app.warm_up() at import: catalog + indexes, templates, one throwaway plan (and the
+# PDF stack with WARMUP_PDF). Use it with `gunicorn --preload app:app` so workers fork warm;
+# PLANNER_WARMUP=1 in the environment does the same without editing this file.
+WARMUP = False
+WARMUP_PDF = True
+IMPORT_BUDGET_MS = 100      # startup_check.py fails when `import app` adds more than this on top of Flask + NumPy (~20 ms today)
+
+# Incremental re-planning: each build_plan stage's output is cached under a hash of its inputs, so a
+# plan that differs from a recent one in a single field (or /plan/<plan_id>/revise) reruns only the
+# stages downstream of that field
+PLAN_STAGE_CACHE_SIZE = 1024    # stage snapshots; 0 disables
+PLAN_STAGE_CACHE_TTL = 3600     # seconds; 0 = no expiry
+
+# Group grocery orders (bulk.py --order-csv/--order-pdf, /bulk/order): one merged list for many plans
+INGREDIENT_ALIASES = {}         # normalized ingredient -> the name it merges under, e.g. {"grilled chicken": "chicken"}
+
+# Multi-week plans (/plan with weeks=N). Week 1 is the regular plan; each later week reruns the
+# pipeline with a perturbed selection seeded by its week number, so the menu rotates. The page
+# streams one week at a time.
+PLAN_MAX_WEEKS = 12
+PLAN_WEEK_JITTER = 0.08         # 0 repeats week 1 every week
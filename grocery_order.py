@@ -0,0 +1,135 @@
+"""Group grocery orders: many plans' grocery lists folded into one deduplicated order.
+
+Plans are reduced to compact lines (plan_lines) as they are built and folded into a running
+index keyed by item, so memory grows with the number of distinct items, never with the number
+of plans. Catalog items are bought in whole packages: portions are summed across every plan
+first and rounded up once. Recipe ingredients merge across recipes under ingredient_key and
+are counted in servings with their share of the recipe's price.
+
+    python bulk.py profiles.jsonl -o /dev/null --order-csv order.csv --order-pdf order.pdf
+"""
+import io, re, csv, math
+from collections import defaultdict
+from catalog_index import recipe_lines, ingredient_key
+
+_AMOUNT = re.compile(r"^\s*(\d+(?:\.\d+)?|\d+/\d+)\s*(.*?)\s*$")
+
+def _amount(text):
+    # "12 oz" -> (12.0, "oz"), "1/2 cup" -> (0.5, "cup"); None when there is no leading number
+    m = _AMOUNT.match(text or "")
+    if not m:
+        return None
+    num, unit = m.groups()
+    if "/" in num:
+        a, b = num.split("/")
+        return (int(a) / int(b), unit) if int(b) else None
+    return float(num), unit
+
+def portions_per_package(package, portion):
+    """How many portions one package holds; 1 unless both sizes share a unit (e.g. 12 oz / 4 oz = 3)."""
+    pkg, por = _amount(package), _amount(portion)
+    if pkg and por and pkg[1] and pkg[1] == por[1] and por[0] > 0:
+        return pkg[0] / por[0]
+    return 1.0
+
+def plan_lines(chosen, extras):
+    """One plan's grocery needs as compact tuples, merged within the plan:
+    ("item", name, aisle, package, portion, portions, package price) for catalog items and
+    ("ingredient", key, aisle, "servings", None, servings, cost of those servings) for recipe ingredients."""
+    items = {}; ings = {}
+    def add_item(r):
+        key = (r["name"], r["package"])
+        if key in items:
+            items[key][5] += 1
+        else:
+            items[key] = ["item", r["name"], r["aisle"], r["package"], r.get("portion"), 1, float(r["price"])]
+    for ch in chosen:
+        r = ch["ref"]
+        if ch["type"] == "rte":
+            add_item(r)
+            continue
+        lines = recipe_lines(r)
+        share = float(r["price_per_serv"]) / max(1, len(lines))
+        aisle = r.get("aisles", ["Center Aisle"])[0]
+        for _, ing in lines:
+            key = (ingredient_key(ing), aisle)
+            if key in ings:
+                ings[key][5] += 1; ings[key][6] += share
+            else:
+                ings[key] = ["ingredient", key[0], aisle, "servings", None, 1, share]
+    for ex in extras:
+        add_item(ex["ref"])
+    return [tuple(v) for v in items.values()] + [tuple(v) for v in ings.values()]
+
+class GroceryOrder:
+    """Running aisle/item index for a group order; fold plans in with add_lines/add_plan."""
+
+    def __init__(self):
+        self.plans = 0
+        self.households = 0
+        self._items = {}                       # (name, package) -> [portion, portions, package price, {aisle: portions}]
+        self._ings = {}                        # key -> [servings, cost, {aisle: servings}]
+
+    def add_lines(self, lines, household=1):
+        household = max(1, int(household or 1))
+        self.plans += 1; self.households += household
+        for kind, name, aisle, package, portion, qty, price in lines:
+            # price: per package for items, total for the servings for ingredients
+            qty *= household
+            if kind == "item":
+                e = self._items.get((name, package))
+                if e is None:
+                    e = self._items[(name, package)] = [portion, 0, price, defaultdict(int)]
+                e[1] += qty; e[3][aisle] += qty
+            else:
+                e = self._ings.get(name)
+                if e is None:
+                    e = self._ings[name] = [0, 0.0, defaultdict(int)]
+                e[0] += qty; e[1] += price * household; e[2][aisle] += qty
+
+    def add_plan(self, chosen, extras, household=1):
+        self.add_lines(plan_lines(chosen, extras), household)
+
+    def __len__(self):
+        return len(self._items) + len(self._ings)
+
+    def rows(self):
+        """Order lines sorted by aisle then name; an ingredient bought for several aisles goes to its most used one."""
+        # ties go to the alphabetically first aisle, so the result does not depend on fold order
+        aisle_of = lambda counts: min(counts, key=lambda a: (-counts[a], a))
+        out = []
+        for (name, package), (portion, portions, price, aisles) in self._items.items():
+            packages = math.ceil(portions / portions_per_package(package, portion) - 1e-9)
+            out.append({"aisle": aisle_of(aisles), "name": name, "qty": portions, "unit": portion or package,
+                        "packages": packages, "package": package, "cost": round(packages * price, 2)})
+        for name, (servings, cost, aisles) in self._ings.items():
+            out.append({"aisle": aisle_of(aisles), "name": name, "qty": servings, "unit": "servings",
+                        "packages": None, "package": "varies", "cost": round(cost, 2)})
+        out.sort(key=lambda r: (r["aisle"], r["name"], r["package"]))
+        return out
+
+    def by_aisle(self, rows=None):
+        grouped = {}
+        for r in (self.rows() if rows is None else rows):
+            grouped.setdefault(r["aisle"], []).append(r)
+        return grouped
+
+    def total(self, rows=None):
+        return round(sum(r["cost"] for r in (self.rows() if rows is None else rows)), 2)
+
+    def write_csv(self, f):
+        w = csv.writer(f)
+        w.writerow(["Aisle","Item","Qty","Unit","Packages","Package","Cost"])
+        rows = self.rows()
+        for r in rows:
+            w.writerow([r["aisle"], r["name"], r["qty"], r["unit"], "" if r["packages"] is None else r["packages"], r["package"], f'{r["cost"]:.2f}'])
+        w.writerow(["", "Total", "", "", "", "", f"{self.total(rows):.2f}"])
+
+    def to_csv(self):
+        buf = io.StringIO()
+        self.write_csv(buf)
+        return buf.getvalue()
+
+    def to_pdf(self, link_base=None):
+        from pdf_render import render_order_pdf
+        return render_order_pdf(self, link_base)
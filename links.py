@@ -0,0 +1,52 @@
+import re, urllib.parse, uuid, hashlib
+from functools import lru_cache
+import config
+
+_NON_ALNUM = re.compile(r"[^A-Za-z0-9 ]+")
+_SPACES = re.compile(r"\\s+")
+INSTACART_SEARCH = "https://www.instacart.com/store/s?k="
+
+@lru_cache(maxsize=4096)
+def clean_query(name: str):
+    # catalog names repeat across every plan, so the cleaned form is cached
+    name = _NON_ALNUM.sub(" ", name).strip().lower()
+    name = _SPACES.sub(" ", name)
+    return urllib.parse.quote_plus(name)
+
+@lru_cache(maxsize=8)
+def _campaign(value):
+    return urllib.parse.quote_plus(value)
+
+def search_url(q):
+    """Instacart search for an already cleaned query, with fresh search/page-view ids."""
+    sid = uuid.uuid4()
+    pvid = uuid.uuid4()
+    return f"{INSTACART_SEARCH}{q}&search_id={sid}&page_view_id={pvid}&utm_campaign={_campaign(getattr(config,'UTM_CAMPAIGN','corporate-cut'))}"
+
+def instacart_search_url(query: str):
+    return search_url(clean_query(query))
+
+# ---------------- /go/<token> links ----------------
+# Pages and PDFs carry /go/<token>; the Instacart URL and its ids are minted only on click.
+# A token is a hash of the grocery line name, so every worker derives the same token for the
+# same line, and catalog loads register every line up front so any worker can resolve it.
+_QUERIES = {}
+
+@lru_cache(maxsize=8192)
+def link_token(name):
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:12]
+
+def register(name):
+    """Cache name's cleaned query under its token; returns the token."""
+    token = link_token(name)
+    if token not in _QUERIES:
+        _QUERIES[token] = clean_query(name)
+    return token
+
+def go_path(name):
+    return "/go/" + register(name)
+
+def resolve(token):
+    """Instacart URL for a token, or None if no catalog line in this process has it."""
+    q = _QUERIES.get(token)
+    return None if q is None else search_url(q)
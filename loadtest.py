@@ -0,0 +1,227 @@
+"""Load generator: replays a JSONL trace of /plan form submissions (and the exports that follow
+them) against a running server and reports throughput, latency percentiles and errors per route.
+
+Each trace line is a JSON object of /plan form fields (goal, bodyweight, calories, meals_per_day,
+budget, time_per_cook, low_carb, ...) plus an optional "exports" list naming what to download
+afterwards from the returned plan: any of "csv", "plan.pdf", "grocery.pdf".
+
+    gunicorn -w 4 -b 127.0.0.1:8000 app:app
+    python loadtest.py --make-trace 500 > trace.jsonl
+    python loadtest.py trace.jsonl --url http://127.0.0.1:8000 --concurrency 8 --duration 60
+    python loadtest.py trace.jsonl --mode open --rate 20 --duration 60 --json report.json
+
+closed: --concurrency users, each sends its next session as soon as the last one finished.
+open: sessions start at --rate per second (Poisson arrivals) whatever the server does, with at
+most --concurrency in flight; latency counts from the scheduled start, so queueing shows up in
+the percentiles instead of silently lowering the offered load.
+"""
+import sys, json, time, random, re, threading, argparse, itertools, queue
+import urllib.request, urllib.parse, urllib.error
+
+EXPORTS = {"csv": "/export/{}/csv", "plan.pdf": "/export/{}/plan.pdf", "grocery.pdf": "/export/{}/grocery.pdf"}
+PLAN_ID_RE = re.compile(r"/export/([0-9a-f]+)/")
+
+# ---------------- traces ----------------
+def make_trace(n, seed=0):
+    """A realistic mix of the values index.html offers: mostly TDEE-derived targets, some explicit
+    calories, a third downloading something."""
+    rng = random.Random(seed)
+    for _ in range(n):
+        row = {
+            "goal": rng.choices(["Fat loss", "Recomp", "Maintenance"], [5, 2, 3])[0],
+            "bodyweight": str(int(rng.gauss(185, 35))),
+            "meals_per_day": str(rng.choices([3, 4, 5], [4, 4, 2])[0]),
+            "budget": str(rng.choice([60, 90, 120, 150, 180, 250])),
+            "time_per_cook": str(rng.choice([5, 10, 15])),
+            "age": str(rng.randint(20, 65)),
+            "activity_level": rng.choices(["sedentary", "light", "moderate", "very", "athlete"], [3, 3, 4, 2, 1])[0],
+            "height_ft": str(rng.choice([5, 6])), "height_in": str(rng.randint(0, 11)),
+        }
+        if rng.random() < 0.3: row["low_carb"] = "on"
+        if rng.random() < 0.25: row["calories"] = str(rng.randrange(1500, 3200, 50))
+        r = rng.random()
+        if r < 0.15: row["exports"] = ["plan.pdf", "grocery.pdf"]
+        elif r < 0.30: row["exports"] = ["grocery.pdf"]
+        elif r < 0.35: row["exports"] = ["csv"]
+        yield row
+
+def read_trace(path):
+    with (sys.stdin if path == "-" else open(path)) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    if not rows:
+        raise SystemExit("empty trace")
+    return rows
+
+# ---------------- requests ----------------
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}       # route -> [seconds]
+        self.errors = {}        # route -> {reason: count}
+        self.server = {}        # route -> {stage: [ms]} from Server-Timing
+
+    def record(self, route, seconds, error=None, server_timing=None):
+        with self.lock:
+            self.latency.setdefault(route, []).append(seconds)
+            if error:
+                errs = self.errors.setdefault(route, {})
+                errs[error] = errs.get(error, 0) + 1
+            if server_timing:
+                stages = self.server.setdefault(route, {})
+                for part in server_timing.split(","):
+                    name, _, dur = part.strip().partition(";dur=")
+                    try: stages.setdefault(name, []).append(float(dur))
+                    except ValueError: pass
+
+def fetch(url, data=None, timeout=60):
+    """(status, body, headers); status 0 means the request never got an HTTP answer."""
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body), timeout=timeout) as resp:
+            return resp.status, resp.read(), resp.headers
+    except urllib.error.HTTPError as e:
+        return e.code, e.read(), e.headers
+    except Exception as e:
+        return 0, type(e).__name__.encode(), {}
+
+def run_session(base_url, row, stats, started=None, timeout=60):
+    """POST /plan then fetch the row's exports; started backdates the first request (open loop)."""
+    form = {k: v for k, v in row.items() if k != "exports"}
+    t0 = started if started is not None else time.perf_counter()
+    status, body, headers = fetch(base_url + "/plan", form, timeout)
+    stats.record("/plan", time.perf_counter() - t0, _error(status, body), headers.get("Server-Timing"))
+    if status != 200:
+        return
+    m = PLAN_ID_RE.search(body.decode("utf-8", "replace"))
+    for kind in row.get("exports") or ():
+        route = "/export/" + kind
+        if m is None or kind not in EXPORTS:
+            stats.record(route, 0.0, "no plan id" if m is None else "unknown export")
+            continue
+        t = time.perf_counter()
+        status, body, headers = fetch(base_url + EXPORTS[kind].format(m.group(1)), timeout=timeout)
+        stats.record(route, time.perf_counter() - t, _error(status, body), headers.get("Server-Timing"))
+
+def _error(status, body):
+    if status == 0:
+        return body.decode("utf-8", "replace")
+    if status >= 400:
+        return f"HTTP {status}"
+    return None
+
+# ---------------- drivers ----------------
+def closed_loop(base_url, rows, stats, concurrency, deadline, max_sessions=None, timeout=60):
+    feed = itertools.cycle(rows) if max_sessions is None else itertools.islice(itertools.cycle(rows), max_sessions)
+    lock = threading.Lock()
+    def user():
+        while time.perf_counter() < deadline:
+            with lock:
+                row = next(feed, None)
+            if row is None:
+                return
+            run_session(base_url, row, stats, timeout=timeout)
+    threads = [threading.Thread(target=user, daemon=True) for _ in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+def open_loop(base_url, rows, stats, concurrency, deadline, rate, max_sessions=None, seed=0, timeout=60):
+    rng = random.Random(seed)
+    pending = queue.Queue()
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            started, row = item
+            run_session(base_url, row, stats, started=started, timeout=timeout)
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads: t.start()
+    at = time.perf_counter()
+    for n, row in enumerate(itertools.cycle(rows)):
+        if max_sessions is not None and n >= max_sessions:
+            break
+        at += rng.expovariate(rate)
+        if at >= deadline:
+            break
+        delay = at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pending.put((at, row))
+    for _ in threads: pending.put(None)
+    for t in threads: t.join()
+
+# ---------------- report ----------------
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k); hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+def summarize(stats, elapsed):
+    routes = {}
+    for route, lat in sorted(stats.latency.items()):
+        lat = sorted(lat)
+        errors = sum(stats.errors.get(route, {}).values())
+        ms = lambda q: round(percentile(lat, q) * 1000, 2)
+        routes[route] = {
+            "requests": len(lat), "errors": errors, "error_rate": round(errors / len(lat), 4),
+            "throughput_rps": round((len(lat) - errors) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": ms(0.50), "p90_ms": ms(0.90), "p99_ms": ms(0.99), "max_ms": round(lat[-1] * 1000, 2),
+            "error_reasons": stats.errors.get(route, {}),
+            "server_mean_ms": {name: round(sum(v) / len(v), 2) for name, v in stats.server.get(route, {}).items()},
+        }
+    return {"elapsed_s": round(elapsed, 2), "routes": routes}
+
+def print_report(summary, out=sys.stdout):
+    out.write(f"elapsed {summary['elapsed_s']}s\n")
+    out.write(f"{'route':<22}{'reqs':>7}{'err%':>7}{'ok/s':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}\n")
+    for route, r in summary["routes"].items():
+        out.write(f"{route:<22}{r['requests']:>7}{r['error_rate']*100:>6.1f}%{r['throughput_rps']:>8.2f}"
+                  f"{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}\n")
+    for route, r in summary["routes"].items():
+        for reason, n in sorted(r["error_reasons"].items(), key=lambda t: -t[1]):
+            out.write(f"  {route}: {n} x {reason}\n")
+        if r["server_mean_ms"]:
+            stages = ", ".join(f"{k} {v}" for k, v in r["server_mean_ms"].items())
+            out.write(f"  {route} server mean ms: {stages}\n")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay /plan traffic from a JSONL trace against a running server.")
+    ap.add_argument("trace", nargs="?", help="JSONL trace ('-' for stdin)")
+    ap.add_argument("--make-trace", type=int, metavar="N", help="print N synthetic trace lines and exit")
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--mode", choices=("closed", "open"), default="closed")
+    ap.add_argument("--concurrency", type=int, default=4, help="closed: users; open: max sessions in flight")
+    ap.add_argument("--rate", type=float, default=10.0, help="open: sessions started per second")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds to keep sending")
+    ap.add_argument("--sessions", type=int, default=None, help="stop after this many sessions")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="also write the summary here")
+    args = ap.parse_args(argv)
+
+    if args.make_trace:
+        for row in make_trace(args.make_trace, args.seed):
+            print(json.dumps(row))
+        return
+    if not args.trace:
+        ap.error("a trace file is required (or --make-trace N)")
+    rows = read_trace(args.trace)
+    base_url = args.url.rstrip("/")
+    stats = Stats()
+    t0 = time.perf_counter()
+    deadline = t0 + args.duration
+    if args.mode == "closed":
+        closed_loop(base_url, rows, stats, max(1, args.concurrency), deadline, args.sessions, args.timeout)
+    else:
+        open_loop(base_url, rows, stats, max(1, args.concurrency), deadline, args.rate, args.sessions, args.seed, args.timeout)
+    summary = dict(summarize(stats, time.perf_counter() - t0), mode=args.mode, concurrency=args.concurrency,
+                   rate=args.rate if args.mode == "open" else None, url=base_url)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
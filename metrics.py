@@ -0,0 +1,169 @@
+import sys, time, threading, contextvars
+from collections import OrderedDict, Counter as _Tally
+from contextlib import contextmanager
+
+# Per-process metrics. Each gunicorn worker keeps its own, so scrape every worker
+# or run a single worker per port when exact totals matter.
+
+BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def _fmt_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+class Histogram:
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0]*len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[0][i] += 1
+            s[1] += value; s[2] += 1
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                for b, c in zip(self.buckets, counts):
+                    out.append(f"{self.name}_bucket{_fmt_labels(key, [('le', b)])} {c}")
+                out.append(f"{self.name}_bucket{_fmt_labels(key, [('le', '+Inf')])} {n}")
+                out.append(f"{self.name}_sum{_fmt_labels(key)} {total:.6f}")
+                out.append(f"{self.name}_count{_fmt_labels(key)} {n}")
+        return out
+
+class Counter:
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, n=1, **labels):
+        if not n:
+            return
+        key = _labels(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + n
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._series.items()):
+                out.append(f"{self.name}{_fmt_labels(key)} {v}")
+        return out
+
+STAGE_SECONDS = Histogram("planner_stage_seconds", "Wall time per planner stage.")
+REQUEST_SECONDS = Histogram("http_request_seconds", "Wall time per request, by endpoint.")
+BALANCE_ITERATIONS = Counter("planner_balance_iterations_total", "balance_macros_for_week loop iterations.")
+CANDIDATES_EVALUATED = Counter("planner_candidates_evaluated_total", "Candidates scored by the balancer.")
+EXTRAS_ADDED = Counter("planner_extras_added_total", "Extras added, by stage.")
+EXTRAS_REMOVED = Counter("planner_extras_removed_total", "Extras removed, by stage.")
+LOOP_EXITS = Counter("planner_loop_exits_total", "Why a balance/top-up loop stopped, by loop and reason.")
+PLAN_RESUMES = Counter("planner_plan_resumes_total", "Plans built from a cached stage, by the last stage reused.")
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, BALANCE_ITERATIONS, CANDIDATES_EVALUATED, EXTRAS_ADDED, EXTRAS_REMOVED, LOOP_EXITS,
+            PLAN_RESUMES]
+
+def reset():
+    """Forget every recorded series (after warm-up, so its plan is not counted)."""
+    for m in REGISTRY:
+        with m._lock:
+            m._series.clear()
+
+def render(gauges=()):
+    """Prometheus text exposition; gauges is an iterable of (name, help, {labels-tuple: value})."""
+    out = []
+    for m in REGISTRY:
+        out += m.render()
+    for name, help, series in gauges:
+        out += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+        out += [f"{name}{_fmt_labels(key)} {v}" for key, v in sorted(series.items())]
+    return "\n".join(out) + "\n"
+
+# ---------------- per-request stage timings ----------------
+_TIMINGS = contextvars.ContextVar("stage_timings", default=None)
+
+def begin_request():
+    _TIMINGS.set([])
+
+def end_request():
+    timings = _TIMINGS.get()
+    _TIMINGS.set(None)
+    return timings or []
+
+@contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, stage=name)
+        timings = _TIMINGS.get()
+        if timings is not None:
+            timings.append((name, dt))
+
+def server_timing(timings, total=None):
+    parts = [f"{name};dur={dt*1000:.2f}" for name, dt in timings]
+    if total is not None:
+        parts.append(f"total;dur={total*1000:.2f}")
+    return ", ".join(parts)
+
+# ---------------- sampling profiler ----------------
+class SamplingProfiler:
+    """Samples one thread's Python stack every interval seconds; output is folded stacks (flamegraph.pl input)."""
+
+    def __init__(self, thread_id=None, interval=0.002):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = _Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common()) + "\n"
+
+class ProfileStore:
+    """The last few folded profiles, by id."""
+
+    def __init__(self, keep=20):
+        self.keep = keep
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, profile_id, text):
+        with self._lock:
+            self._data[profile_id] = text
+            while len(self._data) > self.keep:
+                self._data.popitem(last=False)
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._data.get(profile_id)
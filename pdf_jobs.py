@@ -0,0 +1,80 @@
+import os, threading
+from concurrent.futures import ProcessPoolExecutor
+from pdf_render import render_document, document_key
+
+class PdfJobQueue:
+    """Renders PDFs on a bounded process pool; finished documents land in the shared PdfCache.
+
+    Job ids are "<plan_id>.<kind>", so any request for the same document maps to the same job
+    and a worker that never saw the job can still (re)start it from the plan store. Results are
+    cached under document_key, so a grocery list polled from another origin is rendered for it.
+    """
+
+    def __init__(self, cache, workers=2, max_pending=32):
+        self.cache = cache
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self._pending = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @staticmethod
+    def job_id(kind, plan_id):
+        return f"{plan_id}.{kind}"
+
+    @staticmethod
+    def parse_job_id(job_id):
+        plan_id, _, kind = job_id.rpartition(".")
+        return kind, plan_id
+
+    def _pool(self):
+        # pools do not survive a fork, so each gunicorn worker gets its own
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._pid = os.getpid()
+            self._pending.clear()
+        return self._executor
+
+    def submit(self, kind, plan_id, rec, link_base=None):
+        """Queue a render; returns "done", "pending" or "full" (backpressure)."""
+        key = document_key(kind, plan_id, link_base)
+        if self.cache.get(key) is not None:
+            return "done"
+        with self._lock:
+            if key in self._pending:
+                return "pending"
+            if len(self._pending) >= self.max_pending:
+                return "full"
+            self._errors.pop(key, None)
+            fut = self._pool().submit(render_document, kind, rec, link_base)
+            self._pending[key] = fut
+        fut.add_done_callback(lambda f, key=key: self._finished(key, f))
+        return "pending"
+
+    def _finished(self, key, fut):
+        try:
+            self.cache.put(key, fut.result())
+        except Exception as e:
+            with self._lock:
+                self._errors[key] = f"{type(e).__name__}: {e}"
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def status(self, kind, plan_id, link_base=None):
+        """("done", (etag, pdf)) | ("pending", None) | ("error", message) | (None, None)."""
+        key = document_key(kind, plan_id, link_base)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return "done", entry
+        with self._lock:
+            if key in self._pending:
+                return "pending", None
+            if key in self._errors:
+                return "error", self._errors[key]
+        return None, None
+
+    def queue_length(self):
+        with self._lock:
+            return len(self._pending)
@@ -0,0 +1,198 @@
+import io, hashlib, threading
+from types import SimpleNamespace
+from collections import OrderedDict
+from links import instacart_search_url, go_path
+
+# ---------------- ReportLab, loaded on first render ----------------
+# Importing ReportLab is the largest single cost of importing the app and only the exports use
+# it, so it stays out of cold start; warm_up() (gunicorn --preload) loads it before the fork.
+_RL = None
+
+def reportlab():
+    global _RL
+    if _RL is None:
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+        from reportlab.lib import colors
+        _RL = SimpleNamespace(letter=letter, getSampleStyleSheet=getSampleStyleSheet, ParagraphStyle=ParagraphStyle,
+                              SimpleDocTemplate=SimpleDocTemplate, Paragraph=Paragraph, Spacer=Spacer, Table=Table,
+                              TableStyle=TableStyle, PageBreak=PageBreak, colors=colors)
+    return _RL
+
+# ---------------- shared styles ----------------
+# Paragraph and table styles are immutable once built, so one set serves every render.
+_STYLES = {}
+
+def styles():
+    if not _STYLES:
+        rl = reportlab()
+        ParagraphStyle, TableStyle, colors = rl.ParagraphStyle, rl.TableStyle, rl.colors
+        base = rl.getSampleStyleSheet()
+        _STYLES["title"] = ParagraphStyle("t", parent=base["Title"], fontName="Helvetica-Bold", fontSize=19)
+        _STYLES["h2"] = ParagraphStyle("h2", parent=base["Heading2"], fontName="Helvetica-Bold", fontSize=15)
+        _STYLES["h3"] = ParagraphStyle("h3", parent=base["Heading3"], fontName="Helvetica-Bold", fontSize=12)
+        _STYLES["body"] = ParagraphStyle("body", parent=base["Normal"], fontName="Helvetica", fontSize=10, leading=12, wordWrap='LTR')
+        _STYLES["plan_table"] = TableStyle([
+            ('FONT',(0,0),(-1,-1),'Helvetica'),
+            ('BACKGROUND',(0,0),(-1,0),colors.black),
+            ('TEXTCOLOR',(0,0),(-1,0),colors.white),
+            ('VALIGN',(0,0),(-1,-1),'TOP'),
+            ('ALIGN',(1,1),(-1,-1),'RIGHT'),
+            ('GRID',(0,0),(-1,-1),0.25,colors.grey),
+            ('ROWBACKGROUNDS',(0,1),(-1,-1),[colors.HexColor('#eef2ff'), colors.whitesmoke]),
+        ])
+        _STYLES["grocery_table"] = TableStyle([
+            ('FONT',(0,0),(-1,-1),'Helvetica'),
+            ('BACKGROUND',(0,0),(-1,0),colors.black),
+            ('TEXTCOLOR',(0,0),(-1,0),colors.white),
+            ('VALIGN',(0,0),(-1,-1),'TOP'),
+            ('GRID',(0,0),(-1,-1),0.25,colors.grey),
+            ('ROWBACKGROUNDS',(0,1),(-1,-1),[colors.HexColor('#f1f5f9'), colors.whitesmoke]),
+        ])
+    return _STYLES
+
+def wrapped_paragraph(text, style):
+    text = text.replace("&", "&amp;").replace("<","&lt;").replace(">","&gt;")
+    return reportlab().Paragraph(text, style)
+
+def link_paragraph(url, text, style):
+    return reportlab().Paragraph(f'<link href="{url}">{text}</link>', style)
+
+def _doc(buff, title):
+    rl = reportlab()
+    return rl.SimpleDocTemplate(buff, pagesize=rl.letter, title=title, leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
+
+# ---------------- documents ----------------
+def _weeks(rec):
+    # multi-week records list every week; a one-week record is its own only week
+    return rec.get("weeks") or [rec]
+
+def render_plan_pdf(rec):
+    st = styles(); rl = reportlab()
+    meta, prefs = rec["meta"], rec["prefs"]
+    weeks = _weeks(rec)
+    buff=io.BytesIO()
+    doc=_doc(buff, "Meal Plan")
+    horizon = f"{len(weeks)}-Week Plan" if len(weeks) > 1 else "7-Day Plan"
+    elems=[wrapped_paragraph(f"ActivBlaze Corporate Cut — {horizon}", st["title"])]
+    meta_line = f"Calories/day target: {meta.get('calories')}"
+    if meta.get("bmr") and meta.get("tdee"):
+        meta_line += f" • BMR: {meta.get('bmr')} • TDEE: {meta.get('tdee')}"
+    meta_line += f" • Protein target: {meta.get('protein_g')} g • Budget: ${meta.get('budget')} • Diet: {'Low-carb' if prefs.get('low_carb') else 'Standard 40/30/30'}"
+    elems += [wrapped_paragraph(meta_line, st["body"]), rl.Spacer(1,10)]
+    for w, week in enumerate(weeks, start=1):
+        if len(weeks) > 1:
+            if w > 1: elems.append(rl.PageBreak())
+            elems.append(wrapped_paragraph(f"Week {w}", st["h2"]))
+        for i, day in enumerate(week["days"], start=1):
+            elems.append(wrapped_paragraph(f"Day {i} — {day.get('total_protein',0)} g protein, ~{int(day.get('total_calories',0))} kcal", st["h3"]))
+            data=[["Meal","P","C","F","K"]]
+            for m in day["meals"]:
+                mc=m["macros"]
+                data.append([wrapped_paragraph(m["title"], st["body"]), mc["P"], mc["C"], mc["F"], mc["K"]])
+            elems.extend([rl.Table(data, repeatRows=1, colWidths=[320,45,45,45,55], style=st["plan_table"]), rl.Spacer(1,10)])
+    doc.build(elems)
+    return buff.getvalue()
+
+def render_grocery_pdf(rec, link_for):
+    st = styles(); rl = reportlab()
+    weeks = _weeks(rec)
+    buff=io.BytesIO()
+    doc=_doc(buff, "Grocery List")
+    elems=[wrapped_paragraph("ActivBlaze Corporate Cut — Grocery List", st["title"]), rl.Spacer(1,8)]
+    for w, week in enumerate(weeks, start=1):
+        if len(weeks) > 1:
+            if w > 1: elems.append(rl.PageBreak())
+            elems.append(wrapped_paragraph(f"Week {w}", st["h2"]))
+        for aisle, items in week["grocery"].items():
+            elems.append(wrapped_paragraph(aisle, st["h3"]))
+            data=[["Item","Package","Instacart"]]
+            for it in items:
+                data.append([wrapped_paragraph(it["name"], st["body"]), wrapped_paragraph(it["package"], st["body"]), link_paragraph(link_for(it["name"]), "Open in Instacart", st["body"])])
+            elems.extend([rl.Table(data, repeatRows=1, colWidths=[300,100,160], style=st["grocery_table"]), rl.Spacer(1,6)])
+        elems.append(wrapped_paragraph(f"Estimated Weekly Total: ${week['cost']:.2f}", st["h3"]))
+    if len(weeks) > 1:
+        elems.append(wrapped_paragraph(f"Estimated Total, {len(weeks)} weeks: ${sum(wk['cost'] for wk in weeks):.2f}", st["h3"]))
+    doc.build(elems)
+    return buff.getvalue()
+
+def render_order_pdf(order, link_base=None):
+    """Group order from grocery_order.GroceryOrder: one table per aisle with merged quantities and costs."""
+    st = styles(); rl = reportlab()
+    link_for = (lambda name: link_base + go_path(name)) if link_base else instacart_search_url
+    rows = order.rows()
+    buff=io.BytesIO()
+    doc=_doc(buff, "Group Grocery Order")
+    elems=[wrapped_paragraph("ActivBlaze Corporate Cut — Group Grocery Order", st["title"]),
+           wrapped_paragraph(f"{order.plans} plans • {order.households} households • {len(rows)} items", st["body"]), rl.Spacer(1,8)]
+    for aisle, items in order.by_aisle(rows).items():
+        elems.append(wrapped_paragraph(aisle, st["h3"]))
+        data=[["Item","Qty","Buy","Cost","Instacart"]]
+        for it in items:
+            buy = it["package"] if it["packages"] is None else f'{it["packages"]} x {it["package"]}'
+            data.append([wrapped_paragraph(it["name"], st["body"]), wrapped_paragraph(f'{it["qty"]} {it["unit"]}', st["body"]),
+                         wrapped_paragraph(buy, st["body"]), f'${it["cost"]:.2f}', link_paragraph(link_for(it["name"]), "Open in Instacart", st["body"])])
+        elems.extend([rl.Table(data, repeatRows=1, colWidths=[190,90,100,60,100], style=st["grocery_table"]), rl.Spacer(1,6)])
+    elems.append(wrapped_paragraph(f"Estimated Order Total: ${order.total(rows):.2f}", st["h3"]))
+    doc.build(elems)
+    return buff.getvalue()
+
+def render_document(kind, rec, link_base=None):
+    # module-level so it can be shipped to a worker process. With link_base the grocery links
+    # are short <link_base>/go/<token> redirects; without it, full Instacart search URLs.
+    if kind == "plan":
+        return render_plan_pdf(rec)
+    if kind == "grocery":
+        link_for = (lambda name: link_base + go_path(name)) if link_base else instacart_search_url
+        return render_grocery_pdf(rec, link_for)
+    raise ValueError(f"unknown document: {kind}")
+
+# ---------------- rendered-bytes cache ----------------
+def document_key(kind, plan_id, link_base=None):
+    # the grocery list's /go/ links are absolute, so each origin gets its own copy
+    return (kind, plan_id, link_base if kind == "grocery" else None)
+
+# Bump when the rendered layout changes, so clients holding an old ETag download again.
+RENDER_VERSION = 1
+
+def pdf_etag(key):
+    # ReportLab stamps a creation date and a random document id into every render, so two renders
+    # of one plan never share bytes; the ETag names the document instead: plan ids are immutable.
+    return hashlib.sha1(repr((RENDER_VERSION,) + tuple(key)).encode()).hexdigest()
+
+class PdfCache:
+    """LRU of rendered documents bounded by total bytes; each entry keeps its strong ETag (see pdf_etag)."""
+
+    def __init__(self, max_bytes=64*1024*1024):
+        self.max_bytes = int(max_bytes)
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, pdf):
+        entry = (pdf_etag(key), pdf)
+        if len(pdf) > self.max_bytes:
+            return entry
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[1])
+            self._data[key] = entry
+            self.bytes += len(pdf)
+            while self.bytes > self.max_bytes:
+                _, (_, dropped) = self._data.popitem(last=False)
+                self.bytes -= len(dropped)
+                self.evictions += 1
+        return entry
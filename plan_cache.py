@@ -0,0 +1,48 @@
+import time, threading
+from collections import OrderedDict
+
+class PlanCache:
+    """Bounded plan memo with LRU or FIFO eviction and an optional TTL (seconds, 0 = never expires)."""
+
+    def __init__(self, maxsize=512, ttl=0, policy="lru"):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = float(ttl or 0)
+        self.policy = policy if policy in ("lru", "fifo") else "lru"
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stamp, value = entry
+            if self.ttl and time.monotonic() - stamp > self.ttl:
+                del self._data[key]
+                self.expired += 1; self.misses += 1
+                return None
+            if self.policy == "lru":
+                self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expired": self.expired}
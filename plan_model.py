@@ -0,0 +1,119 @@
+import heapq
+
+MACROS = ("P","C","F","K")
+
+class Meal:
+    __slots__ = ("title","P","C","F","K")
+
+    def __init__(self, title, macros):
+        self.title = title
+        self.P = macros["P"]; self.C = macros["C"]; self.F = macros["F"]; self.K = macros["K"]
+
+    @property
+    def macros(self):
+        return {"P":self.P,"C":self.C,"F":self.F,"K":self.K}
+
+    def copy(self):
+        return Meal(self.title, self.macros)
+
+    def to_dict(self):
+        return {"title":self.title,"macros":self.macros}
+
+class Day:
+    """Meals for one day with running P/C/F/K totals and a lazy min-heap for the lightest meal."""
+    __slots__ = ("meals","P","C","F","K","_heap")
+
+    def __init__(self, meals=()):
+        self.meals = []
+        self.P = self.C = self.F = self.K = 0
+        self._heap = []
+        for m in meals:
+            self.add_meal(m)
+
+    def add_meal(self, meal):
+        self.meals.append(meal)
+        self.P += meal.P; self.C += meal.C; self.F += meal.F; self.K += meal.K
+        heapq.heappush(self._heap, (meal.K, len(self.meals)-1))
+
+    def totals(self):
+        return self.P, self.C, self.F, self.K
+
+    def lightest(self):
+        # same pick as min(range(n), key=kcal): lowest kcal, then lowest index
+        heap, meals = self._heap, self.meals
+        while heap[0][0] != meals[heap[0][1]].K:
+            heapq.heappop(heap)
+        return heap[0][1]
+
+    def _touched(self, m_idx):
+        if len(self._heap) > 4*len(self.meals) + 16:
+            self._heap = [(m.K, i) for i, m in enumerate(self.meals)]
+            heapq.heapify(self._heap)
+        else:
+            heapq.heappush(self._heap, (self.meals[m_idx].K, m_idx))
+
+    def add(self, m_idx, macros):
+        meal = self.meals[m_idx]
+        P, C, F, K = macros["P"], macros["C"], macros["F"], macros["K"]
+        meal.P += P; meal.C += C; meal.F += F; meal.K += K
+        self.P += P; self.C += C; self.F += F; self.K += K
+        self._touched(m_idx)
+
+    def remove(self, m_idx, macros):
+        # meal macros are clamped at zero, totals move by the clamped delta
+        meal = self.meals[m_idx]
+        for k in MACROS:
+            old = getattr(meal, k)
+            new = max(0, old - macros[k])
+            setattr(meal, k, new)
+            setattr(self, k, getattr(self, k) + new - old)
+        self._touched(m_idx)
+
+    def copy(self):
+        # totals are carried over rather than re-summed, so float macros stay bit-identical
+        day = Day.__new__(Day)
+        day.meals = [m.copy() for m in self.meals]
+        day.P, day.C, day.F, day.K = self.P, self.C, self.F, self.K
+        day._heap = list(self._heap)
+        return day
+
+    def to_dict(self):
+        return {"meals":[m.to_dict() for m in self.meals],"total_protein":self.P,"total_calories":self.K}
+
+class ExtraItems:
+    """Insertion-ordered extras with a per-day index; removal is O(1) by identity instead of a list scan."""
+    __slots__ = ("_items","_by_day")
+
+    def __init__(self, items=()):
+        self._items = {}
+        self._by_day = {}
+        for ex in items:
+            self.append(ex)
+
+    def append(self, ex):
+        self._items[id(ex)] = ex
+        self._by_day.setdefault(ex.get("day"), {})[id(ex)] = ex
+
+    def remove(self, ex):
+        del self._items[id(ex)]
+        del self._by_day[ex.get("day")][id(ex)]
+
+    def for_day(self, day):
+        # extras for one day, in list order
+        return self._by_day.get(day, {}).values()
+
+    def sort(self, key, reverse=False):
+        items = sorted(self._items.values(), key=key, reverse=reverse)
+        self._items = {}; self._by_day = {}
+        for ex in items:
+            self.append(ex)
+
+    def copy(self):
+        # fresh extra dicts (catalog refs stay shared); per-day order follows list order either way
+        return ExtraItems(dict(ex) for ex in self._items.values())
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,92 @@
+import os, json, zlib, time, uuid, sqlite3, threading, tempfile
+from collections import OrderedDict
+
+# ---------------- serialization ----------------
+def encode_plan(record):
+    return zlib.compress(json.dumps(record, separators=(",",":")).encode("utf-8"), 6)
+
+def decode_plan(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+def new_plan_id():
+    return uuid.uuid4().hex
+
+# ---------------- stores ----------------
+class MemoryPlanStore:
+    """Single-process store: LRU bounded by entry count, entries expire after ttl seconds."""
+
+    def __init__(self, maxsize=1000, ttl=86400):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl or 0)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, record, plan_id=None):
+        plan_id = plan_id or new_plan_id()
+        blob = encode_plan(record)
+        with self._lock:
+            self._data[plan_id] = (time.time(), blob)
+            self._data.move_to_end(plan_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return plan_id
+
+    def get(self, plan_id):
+        with self._lock:
+            entry = self._data.get(plan_id)
+            if entry is None:
+                return None
+            if self.ttl and time.time() - entry[0] > self.ttl:
+                del self._data[plan_id]
+                return None
+            self._data.move_to_end(plan_id)
+        return decode_plan(entry[1])
+
+class SQLitePlanStore:
+    """File-backed store shared by every worker on the host; expired rows are swept on write."""
+
+    SWEEP_EVERY = 64
+
+    def __init__(self, path, ttl=86400):
+        self.path = path
+        self.ttl = float(ttl or 0)
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS plans (id TEXT PRIMARY KEY, created REAL NOT NULL, blob BLOB NOT NULL)")
+            con.execute("CREATE INDEX IF NOT EXISTS plans_created ON plans(created)")
+
+    def _conn(self):
+        # one connection per thread and per process (connections must not cross a fork)
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con; self._local.pid = os.getpid()
+        return con
+
+    def put(self, record, plan_id=None):
+        plan_id = plan_id or new_plan_id()
+        now = time.time()
+        con = self._conn()
+        con.execute("INSERT OR REPLACE INTO plans (id, created, blob) VALUES (?,?,?)", (plan_id, now, encode_plan(record)))
+        self._writes += 1
+        if self.ttl and self._writes % self.SWEEP_EVERY == 0:
+            con.execute("DELETE FROM plans WHERE created < ?", (now - self.ttl,))
+        return plan_id
+
+    def get(self, plan_id):
+        row = self._conn().execute("SELECT created, blob FROM plans WHERE id=?", (plan_id,)).fetchone()
+        if row is None:
+            return None
+        if self.ttl and time.time() - row[0] > self.ttl:
+            return None
+        return decode_plan(row[1])
+
+def make_plan_store(kind="memory", path=None, maxsize=1000, ttl=86400):
+    if kind == "sqlite":
+        return SQLitePlanStore(path or os.path.join(tempfile.gettempdir(), "activblaze-plans.sqlite3"), ttl=ttl)
+    if kind == "memory":
+        return MemoryPlanStore(maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"unknown plan store: {kind}")
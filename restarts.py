@@ -0,0 +1,68 @@
+import os, time, threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from catalog_index import load_catalog
+
+_POOL = {"executor": None, "pid": None, "warm": False}
+_LOCK = threading.Lock()
+
+def _init_worker():
+    load_catalog()
+
+def _ready():
+    return os.getpid()
+
+def _pool(workers):
+    # one warm pool per gunicorn worker process; pools cannot cross a fork
+    with _LOCK:
+        if _POOL["executor"] is None or _POOL["pid"] != os.getpid():
+            _POOL["executor"] = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            _POOL["pid"] = os.getpid(); _POOL["warm"] = False
+        return _POOL["executor"]
+
+def warm(workers):
+    """The pool, with its processes started and their catalogs loaded.
+
+    Processes start on first submit, which would otherwise eat the first request's time limit.
+    """
+    ex = _pool(workers)
+    if not _POOL["warm"]:
+        wait([ex.submit(_ready) for _ in range(workers)])
+        _POOL["warm"] = True
+    return ex
+
+def run_variant(target, meals_per_day, budget, time_per_cook, low_carb, days, solver, variant):
+    from app import build_plan
+    return build_plan(target, meals_per_day, budget, time_per_cook, low_carb, load_catalog(), days, solver, variant)
+
+def best_of_restarts(baseline_fn, target, meals_per_day, budget, time_per_cook, low_carb, days=7, solver=None,
+                     n=4, workers=None, time_limit_ms=150, jitter=0.08, seed=0):
+    """Run n perturbed variants on the pool while baseline_fn() builds the normal plan here.
+
+    Keeps the lowest total day_penalty among plans that stay within the budget (or within the
+    baseline's own cost when even the baseline cannot meet it). Variants still running when
+    time_limit_ms expires are dropped, so the baseline is always a valid fallback. Starting the
+    pool (first call in a process) does not count against time_limit_ms.
+    """
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    ex = warm(workers)
+    t0 = time.perf_counter()
+    futures = [ex.submit(run_variant, target, meals_per_day, budget, time_per_cook, low_carb, days, solver, (seed + i, jitter))
+               for i in range(1, n + 1)]
+    best = baseline_fn()
+    baseline_penalty = best["penalty"]
+    limit = max(float(budget), best["total_cost"])
+    remaining = max(0.0, time_limit_ms/1000.0 - (time.perf_counter() - t0))
+    done, not_done = wait(futures, timeout=remaining)
+    for f in not_done:
+        f.cancel()
+    tried = 0
+    for f in done:
+        try:
+            res = f.result()
+        except Exception:
+            continue
+        tried += 1
+        if res["total_cost"] <= limit + 1e-9 and res["penalty"] < best["penalty"]:
+            best = res
+    return dict(best, restarts={"requested": n, "finished": tried, "baseline_penalty": round(baseline_penalty, 6),
+                                "penalty": round(best["penalty"], 6), "elapsed_ms": round((time.perf_counter() - t0)*1000, 2)})
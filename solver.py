@@ -0,0 +1,130 @@
+import time
+import numpy as np
+
+MACROS = ("P","C","F","K")
+
+def day_lower_bound(base, target_K, protein_cap):
+    # extras only add macros, so a day whose fixed meals already overshoot kcal or the
+    # protein cap can never score below these two terms (the rest of day_penalty is >= 0)
+    P, K = base["P"], base["K"]
+    lb = 0.0
+    if K > target_K:
+        lb += (K - target_K) / target_K * 3
+    if protein_cap is not None and P > protein_cap:
+        lb += (P - protein_cap) / max(1, protein_cap) * 8.0
+    return lb
+
+def improve_week(days_plan, extras, pool, target, cost, budget, penalty_vec, add_extra, deadline_ms=50, max_copies=3):
+    """Anytime local search over each day's extras, starting from the greedy plan.
+
+    Each day is a bounded knapsack over the RTE pool: its fixed meals plus up to max_copies of
+    any pool item (more only if the greedy plan already had them), minimizing day_penalty with
+    the protein cap as a constraint and one weekly spend limit shared by all days. Moves are
+    add, remove and swap, each scored for every pool item at once with penalty_vec. Only
+    strictly improving moves are taken, so the result is never worse than the greedy plan.
+    When the deadline passes, the best plan found so far is returned.
+
+    pool: {"items", "P","C","F","K","price"} columns. add_extra(day, item, extras, day_index)
+    attaches an item the same way the greedy does. Returns a report dict with greedy_penalty,
+    penalty, moves, stop, elapsed_ms and the optimality report: lower_bound is the sum of
+    day_lower_bound over the week and gap = penalty - lower_bound. The bound only counts the
+    overshoot forced by each day's fixed meals, so gap bounds the distance to the optimum from
+    above and is loose; 0 means the plan is provably optimal.
+    """
+    t0 = time.perf_counter()
+    stop_at = t0 + deadline_ms/1000.0
+    target_K = int(target["calories"])
+    protein_target = int(target["protein_g"])
+    protein_cap = int(target.get("protein_cap", protein_target))
+    shares = target["shares"]
+    limit = max(float(budget), float(cost))
+    row = {id(it): i for i, it in enumerate(pool["items"])}
+    cols = {k: pool[k] for k in MACROS}
+    price = pool["price"]
+
+    def pen(t):
+        return float(penalty_vec(np.array([t["P"]], dtype=np.float64), np.array([t["C"]], dtype=np.float64),
+                                 np.array([t["F"]], dtype=np.float64), np.array([t["K"]], dtype=np.float64),
+                                 target_K, protein_target, shares, protein_cap=protein_cap)[0])
+
+    state = []
+    for d_i, day in enumerate(days_plan):
+        tot = dict(zip(MACROS, day.totals()))
+        base = dict(tot)
+        counts = np.zeros(len(pool["items"]), dtype=np.int64)
+        for ex in extras.for_day(d_i):
+            for k in MACROS: base[k] -= ex["ref"]["macros"][k]
+            j = row.get(id(ex["ref"]))
+            if j is not None: counts[j] += 1
+        state.append({"tot": tot, "base": base, "pen": pen(tot), "counts": counts, "done": False,
+                      "lb": day_lower_bound(base, target_K, protein_cap)})
+    greedy_pen = sum(s["pen"] for s in state)
+    spend = float(cost)
+    moves = 0
+    stop = "local_optimum"
+
+    def score(t, dP, dC, dF, dK):
+        P, C, F, K = t["P"]+dP, t["C"]+dC, t["F"]+dF, t["K"]+dK
+        pens = penalty_vec(P, C, F, K, target_K, protein_target, shares, protein_cap=protein_cap)
+        # the cap is a constraint: a move may not push protein over it, or further over it
+        bad = (P > protein_cap) & (P > t["P"])
+        return np.where(bad, np.inf, pens)
+
+    while True:
+        open_days = [i for i, s in enumerate(state) if not s["done"]]
+        if not open_days:
+            break
+        if time.perf_counter() >= stop_at:
+            stop = "deadline"
+            break
+        d_i = max(open_days, key=lambda i: state[i]["pen"] - state[i]["lb"])
+        s = state[d_i]; t = s["tot"]
+        best = (s["pen"] - 1e-12, None)
+
+        # add one pool item
+        ok = (price <= limit - spend + 1e-9) & (s["counts"] < max_copies)
+        if ok.any():
+            pens = np.where(ok, score(t, cols["P"], cols["C"], cols["F"], cols["K"]), np.inf)
+            j = int(np.argmin(pens))
+            if pens[j] < best[0]: best = (float(pens[j]), ("add", j, None))
+
+        day_extras = list(extras.for_day(d_i))
+        for ex in day_extras:
+            m = ex["ref"]["macros"]
+            # remove it
+            rp = float(score(t, np.array([-m["P"]], dtype=np.float64), np.array([-m["C"]], dtype=np.float64),
+                             np.array([-m["F"]], dtype=np.float64), np.array([-m["K"]], dtype=np.float64))[0])
+            if rp < best[0]: best = (rp, ("remove", None, ex))
+            # swap it for a pool item
+            freed = float(ex["ref"]["price"])
+            ok = (price <= limit - spend + freed + 1e-9) & (s["counts"] < max_copies)
+            if ok.any():
+                pens = np.where(ok, score(t, cols["P"]-m["P"], cols["C"]-m["C"], cols["F"]-m["F"], cols["K"]-m["K"]), np.inf)
+                j = int(np.argmin(pens))
+                if pens[j] < best[0]: best = (float(pens[j]), ("swap", j, ex))
+
+        if best[1] is None:
+            s["done"] = True
+            continue
+        kind, j, ex = best[1]
+        day = days_plan[d_i]
+        if ex is not None:
+            day.remove(ex.get("meal",0), ex["ref"]["macros"])
+            extras.remove(ex)
+            spend -= float(ex["ref"]["price"])
+            r = row.get(id(ex["ref"]))
+            if r is not None: s["counts"][r] -= 1
+        if j is not None:
+            item = pool["items"][j]
+            add_extra(day, item, extras, d_i)
+            spend += float(item["price"])
+            s["counts"][j] += 1
+        s["tot"] = dict(zip(MACROS, day.totals()))
+        s["pen"] = pen(s["tot"])
+        moves += 1
+
+    best_pen = sum(s["pen"] for s in state)
+    lower = sum(s["lb"] for s in state)
+    return {"greedy_penalty": round(greedy_pen, 6), "penalty": round(best_pen, 6), "lower_bound": round(lower, 6),
+            "gap": round(best_pen - lower, 6), "moves": moves, "stop": stop,
+            "elapsed_ms": round((time.perf_counter() - t0)*1000, 2)}
@@ -0,0 +1,71 @@
+"""Cold-start budget check: times `import app` in fresh interpreters and exits 1 when the fastest
+run is over budget or when the import pulled in modules that are meant to load lazily.
+
+The budget covers what the app adds on top of its framework: Flask and NumPy are imported and
+timed first, and only the rest of `import app` counts. Their ~200 ms vary with the machine and
+disk cache far more than the app's own share, and a total budget would fail on that noise.
+
+    python startup_check.py                  # budget from config.IMPORT_BUDGET_MS
+    python startup_check.py --budget-ms 300 --runs 7
+    python startup_check.py --importtime     # also print the 15 slowest imports (python -X importtime)
+"""
+import os, sys, json, argparse, subprocess
+import config
+
+# must not be imported by `import app`; the export routes load them on first use
+LAZY = ("reportlab",)
+# imported (and timed) before the app; not counted against the budget
+FRAMEWORK = ("numpy", "flask")
+
+PROBE = """
+import sys, time, json
+t = time.perf_counter()
+import %s
+t1 = time.perf_counter()
+import app
+t2 = time.perf_counter()
+print(json.dumps({"ms": (t2 - t1) * 1000, "framework_ms": (t1 - t) * 1000, "modules": sorted({m.split(".")[0] for m in sys.modules})}))
+""" % ", ".join(FRAMEWORK)
+
+def probe(cwd):
+    # a fresh interpreter per run: nothing cached in-process, and no warm-up hook
+    env = dict(os.environ); env.pop("PLANNER_WARMUP", None)
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def slowest_imports(cwd, n=15):
+    env = dict(os.environ); env.pop("PLANNER_WARMUP", None)
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fail when importing the app gets slower than the budget.")
+    ap.add_argument("--budget-ms", type=float, default=getattr(config, "IMPORT_BUDGET_MS", 100))
+    ap.add_argument("--runs", type=int, default=5, help="fresh interpreters to try; the fastest counts")
+    ap.add_argument("--importtime", action="store_true")
+    args = ap.parse_args(argv)
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    runs = [probe(cwd) for _ in range(max(1, args.runs))]
+    best = min(r["ms"] for r in runs)
+    eager = [m for m in LAZY if m in runs[0]["modules"]]
+    print(f"import app: best {best:.1f} ms of {len(runs)} on top of {', '.join(FRAMEWORK)} "
+          f"(best {min(r['framework_ms'] for r in runs):.1f} ms), budget {args.budget_ms:.0f} ms")
+    if args.importtime:
+        for us, name in slowest_imports(cwd):
+            print(f"  {us/1000:8.1f} ms {name}")
+    failed = False
+    if best > args.budget_ms:
+        print(f"FAIL: cold import is {best - args.budget_ms:.1f} ms over budget"); failed = True
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}"); failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()